@@ -14,17 +14,62 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import sys
 from pathlib import Path
-from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from argparse import ArgumentParser, ArgumentTypeError, RawDescriptionHelpFormatter
 from textwrap import dedent
 
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from miru.database import (
+    DEFAULT_CONFIG,
+    DEFAULT_DATABASE,
+    DEFAULT_PROFILE,
+    PROFILES,
+    connect_database,
+    connect_sqlite,
+    profile_pragmas,
+    read_config,
+)
+from miru.commands import (
+    SUFFIX_FORMATS,
+    decrement,
+    export_file,
+    import_file,
+    increment,
+    list_series,
+    mark,
+    serve,
+    set_seen,
+    sync,
+)
+from miru.migrations import migrate, upgrade
+from miru.rules import DEFAULT_BATCH_SIZE, ORDERS, STATUSES, VIEW_CRITERIA
+from miru.trace import startup
 
-from miru.interface import MainWindow
-from miru.models import Base
+DEFAULT_FLUSH_DELAY = 1.0
 
-DEFAULT_DATABASE = str(Path("~/.miru.db").expanduser())
+DEFAULT_REFRESH_INTERVAL = 1.0
+
+DEFAULT_HOST = "127.0.0.1"
+
+DEFAULT_PORT = 8573
+
+DEFAULT_READERS = 2
+
+FORMATS = sorted(set(SUFFIX_FORMATS.values()))
+
+
+def count(value):
+    number = int(value)
+    if number < 0:
+        raise ArgumentTypeError("must not be negative: {}".format(value))
+    return number
+
+
+def positive(value):
+    number = int(value)
+    if number < 1:
+        raise ArgumentTypeError("must be positive: {}".format(value))
+    return number
 
 
 def parse_args():
@@ -33,11 +78,12 @@ def parse_args():
         Keys
         h\t: Move to a view in left
         l\t: Move to a view in right
-        1-5\t: Move to a spesific view
+        g1-g5\t: Move to a spesific view
         j\t: Focus next item
         k\t: Focus previous item
         i\t: Increment seen episodes count for selected series
         d\t: Decrement seen episodes count for selected series
+        Ni, Nd\t: Increment or decrement by N episodes
         s\t: Set seen episodes count to an arbitrary number
         ma\t: Mark series as active
         mh\t: Mark series as on hold
@@ -48,7 +94,15 @@ def parse_args():
         oe\t: Order by episode count
         a\t: Add new series
         x\t: Delete selected series
+        r\t: Recount view totals
+        t\t: Show statistics
+        /\t: Search the view by name as you type
+        space\t: Select or unselect series and move to the next one
+        V\t: Start selecting a range of series, or end the range
+        esc\t: Clear the selection or the search
         q, Q\t: Exit Miru
+
+        When series are selected, i, d, m, s and x apply to all of them.
 	"""
     )
     parser = ArgumentParser(
@@ -59,23 +113,241 @@ def parse_args():
     parser.add_argument(
         "-m", "--memory", action="store_true", help="Use temporary in-memory database"
     )
+    parser.add_argument("-d", "--database", help="Path to a database")
+    parser.add_argument(
+        "-c", "--config", default=DEFAULT_CONFIG, help="Path to a configuration file"
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        choices=sorted(PROFILES),
+        help="SQLite performance profile (default: {})".format(DEFAULT_PROFILE),
+    )
+    parser.add_argument(
+        "-f",
+        "--flush-delay",
+        type=float,
+        default=DEFAULT_FLUSH_DELAY,
+        metavar="SECONDS",
+        help="Commit changes after they have been idle for this long "
+        "(0 commits every change immediately)",
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        type=float,
+        default=DEFAULT_REFRESH_INTERVAL,
+        metavar="SECONDS",
+        help="How often to check for changes made by other processes "
+        "(0 disables checking)",
+    )
+    parser.add_argument(
+        "--startup-trace",
+        action="store_true",
+        help="Print how long each step of starting up took on exit",
+    )
+    parser.add_argument(
+        "--instrument",
+        metavar="FILE",
+        help="Measure the latency and queries of each action and write a "
+        "summary to FILE on exit",
+    )
     parser.add_argument(
-        "-d", "--database", default=DEFAULT_DATABASE, help="Path to a database"
+        "--instrument-overlay",
+        action="store_true",
+        help="With --instrument, show the cost of the last action on screen",
+    )
+    parser.add_argument(
+        "--catalog",
+        metavar="FILE",
+        help="CSV or JSON Lines file of known titles and their episode counts "
+        "to complete names of new series from",
+    )
+    parser.set_defaults(func=run_interface, plain=False, threaded=False)
+    commands = parser.add_subparsers(title="commands", dest="command")
+    import_parser = commands.add_parser(
+        "import", help="Import series from a CSV or JSON Lines file"
     )
-    return parser.parse_args()
+    import_parser.add_argument("file", help="File to import, - for standard input")
+    import_parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        help="Input format, guessed from the file name by default",
+    )
+    import_parser.add_argument(
+        "--upsert",
+        action="store_true",
+        help="Update existing series with the same name instead of adding new ones",
+    )
+    import_parser.add_argument(
+        "--batch-size",
+        type=positive,
+        default=DEFAULT_BATCH_SIZE,
+        help="Number of rows written per transaction",
+    )
+    import_parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Stop at the first invalid row instead of skipping it",
+    )
+    import_parser.set_defaults(func=import_file)
+    export_parser = commands.add_parser(
+        "export", help="Export series as CSV, JSON Lines or in a binary format"
+    )
+    export_parser.add_argument(
+        "-o", "--output", default="-", help="Output file, standard output by default"
+    )
+    export_parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        help="Output format, guessed from the file name and CSV by default",
+    )
+    export_parser.add_argument(
+        "--view", choices=list(VIEW_CRITERIA), help="Only export series in a view"
+    )
+    export_parser.add_argument(
+        "--order",
+        choices=ORDERS,
+        default="name",
+        help="Column to order the series by",
+    )
+    export_parser.add_argument(
+        "--backup",
+        action="store_true",
+        help="Copy the whole database to the output file as a consistent "
+        "snapshot using SQLite's online backup",
+    )
+    export_parser.set_defaults(func=export_file)
+    add_series_commands(commands)
+    args = parser.parse_args()
+    peers = getattr(args, "peers", [])
+    if len(peers) > 2:
+        parser.error("sync takes at most two databases")
+    if len(peers) == 2:
+        # The first of two databases takes the place of the default one.
+        if not Path(peers[0]).expanduser().is_file():
+            parser.error("No database at {}".format(peers[0]))
+        args.database, args.peers, args.memory = peers[0], peers[1:], False
+    return args
 
 
-def connect_database(path, memory=False):
-    return create_engine(
-        "sqlite:///%s" % (":memory:" if memory else str(Path(path).absolute()))
+def add_series_commands(commands):
+    """Commands for scripts, which work on a plain sqlite3 connection."""
+    for name, func, help_text in (
+        ("inc", increment, "Add seen episodes to a series"),
+        ("dec", decrement, "Remove seen episodes from a series"),
+    ):
+        series_parser = commands.add_parser(name, help=help_text)
+        series_parser.add_argument("name", help="Name of the series")
+        series_parser.add_argument(
+            "count", type=count, nargs="?", default=1, help="Number of episodes"
+        )
+        series_parser.set_defaults(func=func, plain=True)
+    set_parser = commands.add_parser("set", help="Set the seen episodes of a series")
+    set_parser.add_argument("name", help="Name of the series")
+    set_parser.add_argument("seen", type=count, help="Number of seen episodes")
+    set_parser.set_defaults(func=set_seen, plain=True)
+    mark_parser = commands.add_parser("mark", help="Change the status of a series")
+    mark_parser.add_argument("name", help="Name of the series")
+    mark_parser.add_argument("status", choices=("active",) + STATUSES)
+    mark_parser.set_defaults(func=mark, plain=True)
+    list_parser = commands.add_parser(
+        "ls", help="List series as tab separated name, seen, episodes and status"
+    )
+    list_parser.add_argument(
+        "--view", choices=list(VIEW_CRITERIA), help="Only list series in a view"
+    )
+    list_parser.add_argument(
+        "--order", choices=ORDERS, default="name", help="Column to order the series by"
     )
+    list_parser.set_defaults(func=list_series, plain=True)
+    serve_parser = commands.add_parser(
+        "serve", help="Serve the series as JSON over HTTP until interrupted"
+    )
+    serve_parser.add_argument(
+        "--host",
+        default=DEFAULT_HOST,
+        help="Address to listen on (default: %(default)s)",
+    )
+    serve_parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help="Port to listen on (default: %(default)s)",
+    )
+    serve_parser.add_argument(
+        "--socket", metavar="PATH", help="Listen on a Unix socket instead"
+    )
+    serve_parser.add_argument(
+        "--readers",
+        type=count,
+        default=DEFAULT_READERS,
+        help="Number of connections serving reads (default: %(default)s)",
+    )
+    serve_parser.set_defaults(func=serve, plain=True, threaded=True)
+    sync_parser = commands.add_parser(
+        "sync", help="Exchange the changes made to two databases since last time"
+    )
+    sync_parser.add_argument(
+        "peers",
+        metavar="DATABASE",
+        nargs="+",
+        help="Database to synchronize with the default one, or two databases "
+        "to synchronize with each other",
+    )
+    sync_parser.set_defaults(func=sync, plain=True)
+
+
+def run_interface(engine, args):
+    # urwid is only needed by the interface.
+    from miru.interface import MainWindow
+
+    startup.mark("import interface")
+    catalog = args.catalog or read_config(args.config, "interface").get("catalog")
+    if catalog:
+        catalog = str(Path(catalog).expanduser())
+    if not args.instrument:
+        return MainWindow(
+            engine, args.flush_delay, args.refresh_interval, catalog
+        ).main()
+    from miru.profiling import Profiler
+
+    profiler = Profiler(args.instrument_overlay)
+    profiler.install(engine)
+    try:
+        window = MainWindow(engine, args.flush_delay, args.refresh_interval, catalog)
+        profiler.attach(window)
+        return window.main()
+    finally:
+        profiler.write(args.instrument)
 
 
 def main():
     args = parse_args()
-    engine = connect_database(args.database, args.memory)
-    Base.metadata.create_all(engine)
-    # pylint: disable=C0103
-    Session = sessionmaker(engine)
-    session = Session()
-    MainWindow(session).main()
+    config = read_config(args.config)
+    database = args.database or config.get("path") or DEFAULT_DATABASE
+    pragmas = profile_pragmas(
+        args.profile or config.get("profile", DEFAULT_PROFILE), config
+    )
+    path = str(Path(database).expanduser())
+    startup.mark("read arguments and configuration")
+    try:
+        if args.plain:
+            connection = connect_sqlite(path, args.memory, pragmas, args.threaded)
+            try:
+                migrate(connection)
+                startup.mark("connect and check schema")
+                failure = args.func(connection, args)
+            finally:
+                connection.close()
+        else:
+            engine = connect_database(path, args.memory, pragmas)
+            upgrade(engine)
+            startup.mark("connect and check schema")
+            failure = args.func(engine, args)
+    finally:
+        if args.startup_trace:
+            startup.report()
+    # Commands exit on their own when they fail, but the interface keeps
+    # going after a failure to save and has it returned instead.
+    if failure is not None:
+        sys.exit(failure)
@@ -0,0 +1,241 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmarks of the interface on synthetic libraries. The interface is
+# driven by feeding keys to its main loop and rendering the result at a
+# fixed size, without a terminal. Results are written as JSON so that runs
+# on different commits can be compared:
+#
+#     python -m miru.benchmark --sizes 1000 100000 -o results.json
+
+import io
+import json
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from pathlib import Path
+from statistics import median
+
+import sqlalchemy
+import urwid
+
+from miru.database import (
+    DEFAULT_PROFILE,
+    PROFILES,
+    connect_database,
+    profile_pragmas,
+)
+from miru.interface import MainWindow
+from miru.migrations import upgrade
+from miru.models import series_table
+from miru.rules import STATUSES
+
+DEFAULT_SIZES = (1000, 10000)
+
+DEFAULT_DISTRIBUTION = {
+    "current": 0.4,
+    "completed": 0.3,
+    "hold": 0.1,
+    "dropped": 0.1,
+    "planned": 0.1,
+}
+
+SCREEN_SIZE = (80, 24)
+
+
+def synthetic_series(size, distribution, seed=0):
+    """Rows for `size` series whose statuses follow `distribution`, which
+    maps view names to weights."""
+    generator = random.Random(seed)
+    kinds = list(distribution)
+    weights = [distribution[kind] for kind in kinds]
+    for _ in range(size):
+        kind = generator.choices(kinds, weights)[0]
+        episodes = generator.randint(1, 200)
+        if kind == "completed":
+            seen = episodes
+        elif kind == "current":
+            seen = generator.randrange(episodes)
+        else:
+            seen = generator.randint(0, episodes)
+        yield {
+            "name": "Series {:07d}".format(generator.randrange(10 * size)),
+            "episodes": episodes,
+            "seen": seen,
+            "status": kind if kind in STATUSES else None,
+        }
+
+
+def populate(engine, rows, batch_size=5000):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            engine.execute(series_table.insert(), batch)
+            batch = []
+    if batch:
+        engine.execute(series_table.insert(), batch)
+
+
+class Session:
+    """MainWindow driven without a terminal. Every action is followed by a
+    render of the whole screen, as the main loop would do. Changes are
+    committed right away on the calling thread, so the timings of edits
+    include writing them."""
+
+    def __init__(self, engine):
+        self.window = MainWindow(engine)
+        self.render()
+
+    def render(self):
+        self.window.frame.render(SCREEN_SIZE, focus=True)
+
+    def press(self, *keys):
+        for key in keys:
+            self.window.loop.process_input([key])
+        self.render()
+
+
+def timed(action, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        action()
+        timings.append(time.perf_counter() - start)
+    return {
+        "runs": len(timings),
+        "min_ms": min(timings) * 1000,
+        "median_ms": median(timings) * 1000,
+        "max_ms": max(timings) * 1000,
+    }
+
+
+def run(size, distribution, repeat=20, seed=0, pragmas=None):
+    """Time the interface's operations on a fresh database of `size` series."""
+    with tempfile.TemporaryDirectory() as directory:
+        engine = connect_database(str(Path(directory) / "miru.db"), pragmas=pragmas)
+        upgrade(engine)
+        populate(engine, synthetic_series(size, distribution, seed))
+        results = {}
+        sessions = []
+
+        def start():
+            sessions.append(Session(engine))
+
+        results["startup"] = timed(start, max(1, repeat // 4))
+        session = sessions[-1]
+
+        def load_all():
+            session.window.store.loaded.clear()
+            session.window.store.load()
+
+        results["load_all_views"] = timed(load_all, max(1, repeat // 4))
+        results["switch_view"] = timed(lambda: session.press("l"), repeat)
+        session.press("g", "1")
+        results["increment"] = timed(lambda: session.press("i"), repeat)
+        results["decrement"] = timed(lambda: session.press("d"), repeat)
+        results["scroll"] = timed(lambda: session.press("j"), repeat)
+
+        def reorder():
+            session.press("o", "s")
+            session.press("o", "n")
+
+        results["reorder"] = timed(reorder, max(1, repeat // 4))
+        results["delete"] = timed(lambda: session.press("x", "y", "enter"), repeat)
+        results["recount_totals"] = timed(lambda: session.press("r"), repeat)
+        session.window.writer.close()
+        engine.dispose()
+    return results
+
+
+def parse_distribution(text):
+    distribution = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in DEFAULT_DISTRIBUTION:
+            raise ValueError("Unknown view: {}".format(name))
+        distribution[name] = float(weight)
+    return distribution
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark Miru on synthetic libraries.")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="Numbers of series to benchmark with",
+    )
+    parser.add_argument(
+        "--distribution",
+        type=parse_distribution,
+        default=DEFAULT_DISTRIBUTION,
+        help="Weights of the views as view=weight pairs separated by commas, "
+        "e.g. current=0.5,completed=0.5",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="Number of times to repeat actions"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--profile",
+        choices=sorted(PROFILES),
+        default=DEFAULT_PROFILE,
+        help="SQLite performance profile (default: {})".format(DEFAULT_PROFILE),
+    )
+    parser.add_argument(
+        "-o", "--output", default="-", help="Output file, standard output by default"
+    )
+    args = parser.parse_args()
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "urwid": urwid.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "profile": args.profile,
+        "distribution": args.distribution,
+        "seed": args.seed,
+        "results": [],
+    }
+    for size in args.sizes:
+        print("Benchmarking with {} series".format(size), file=sys.stderr)
+        # The interface writes the terminal title to standard output.
+        with redirect_stdout(io.StringIO()):
+            results = run(
+                size,
+                args.distribution,
+                args.repeat,
+                args.seed,
+                profile_pragmas(args.profile),
+            )
+        report["results"].append({"size": size, "timings": results})
+    output = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(output)
+    else:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Implementations of the command line subcommands. Each takes the database
+# engine and the parsed arguments, except for the commands editing single
+# series, which take a plain sqlite3 connection instead. Those are run from
+# scripts and shell aliases, so they stay clear of SQLAlchemy and apply the
+# rules of miru.rules with one UPDATE each. Modules that pull in SQLAlchemy
+# are only imported by the commands that need them.
+
+import sys
+import time
+from pathlib import Path
+
+from miru.rules import (
+    ADD_VIEWS,
+    REMOVE_VIEWS,
+    SET_SEEN,
+    SET_STATUS,
+    VIEW_CRITERIA,
+    VIEW_FILTERS,
+)
+
+SUFFIX_FORMATS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".bin": "binary",
+}
+
+
+def _open_input(path, binary=False):
+    if path == "-":
+        return sys.stdin.buffer if binary else sys.stdin
+    if binary:
+        return open(path, "rb")
+    return open(path, newline="", encoding="utf-8")
+
+
+def _open_output(path, binary=False):
+    if path == "-":
+        return sys.stdout.buffer if binary else sys.stdout
+    if binary:
+        return open(path, "wb")
+    return open(path, "w", newline="", encoding="utf-8")
+
+
+def import_file(engine, args):
+    from miru.transfer import BINARY_FORMATS, READERS, InvalidRow, import_series
+
+    input_format = args.format or SUFFIX_FORMATS.get(Path(args.file).suffix.lower())
+    if input_format is None:
+        sys.exit("Can not guess the format of {}, use --format".format(args.file))
+
+    def report_invalid(number, error):
+        print("Line {}: {}".format(number, error), file=sys.stderr)
+
+    start = time.perf_counter()
+    with _open_input(args.file, input_format in BINARY_FORMATS) as stream:
+        try:
+            result = import_series(
+                engine,
+                READERS[input_format](stream),
+                args.batch_size,
+                args.upsert,
+                None if args.strict else report_invalid,
+            )
+        except InvalidRow as error:
+            sys.exit(str(error))
+    elapsed = time.perf_counter() - start
+    total = sum(result)
+    print(
+        "Imported {} series ({} updated, {} replaced by later rows, {} skipped) "
+        "in {:.2f} s, {:.0f} rows per second".format(
+            result.inserted + result.updated,
+            result.updated,
+            result.replaced,
+            result.skipped,
+            elapsed,
+            total / elapsed if elapsed else total,
+        ),
+        file=sys.stderr,
+    )
+
+
+def export_file(engine, args):
+    from miru.transfer import BINARY_FORMATS, WRITERS, InvalidRow, export_rows
+
+    if args.backup:
+        backup_database(engine, args.output)
+        return
+    output_format = args.format or SUFFIX_FORMATS.get(
+        Path(args.output).suffix.lower(), "csv"
+    )
+    criterion = VIEW_CRITERIA[args.view] if args.view else None
+    rows = export_rows(engine, criterion, args.order)
+    with _open_output(args.output, output_format in BINARY_FORMATS) as stream:
+        try:
+            WRITERS[output_format](stream, rows)
+        except InvalidRow as error:
+            sys.exit(str(error))
+
+
+def backup_database(engine, destination):
+    from miru.transfer import backup
+
+    if destination == "-":
+        sys.exit("A backup needs a destination file, use --output")
+
+    def report(remaining, total):
+        print(
+            "\rCopied {} of {} pages".format(total - remaining, total),
+            end="",
+            file=sys.stderr,
+        )
+
+    backup(engine, destination, progress=report if sys.stderr.isatty() else None)
+    if sys.stderr.isatty():
+        print(file=sys.stderr)
+
+
+def _print_series(rows):
+    for name, seen, episodes, status in rows:
+        print("{}\t{}\t{}\t{}".format(name, seen, episodes, status or ""))
+
+
+def _update_series(connection, name, assignments, **params):
+    # Names are not unique, so a change hitting several series is rolled
+    # back rather than guessing which one was meant.
+    with connection:
+        cursor = connection.execute(
+            "UPDATE series SET {} WHERE name = :name".format(assignments),
+            dict(params, name=name),
+        )
+        if cursor.rowcount == 0:
+            sys.exit("No series named {}".format(name))
+        if cursor.rowcount > 1:
+            sys.exit("{} series are named {}".format(cursor.rowcount, name))
+    _print_series(
+        connection.execute(
+            "SELECT name, seen, episodes, status FROM series WHERE name = ?", (name,)
+        )
+    )
+
+
+def increment(connection, args):
+    _update_series(connection, args.name, ADD_VIEWS, count=args.count)
+
+
+def decrement(connection, args):
+    _update_series(connection, args.name, REMOVE_VIEWS, count=args.count)
+
+
+def set_seen(connection, args):
+    _update_series(connection, args.name, SET_SEEN, count=args.seen)
+
+
+def mark(connection, args):
+    status = None if args.status == "active" else args.status
+    _update_series(connection, args.name, SET_STATUS, status=status)
+
+
+def list_series(connection, args):
+    query = "SELECT name, seen, episodes, status FROM series"
+    if args.view:
+        query += " WHERE " + VIEW_FILTERS[args.view]
+    _print_series(connection.execute(query + " ORDER BY {}, id".format(args.order)))
+
+
+def serve(connection, args):
+    from miru.server import serve as run_server
+
+    run_server(connection, args)
+
+
+def _open_peer(path):
+    from miru.database import connect_sqlite
+    from miru.migrations import migrate
+
+    path = Path(path).expanduser()
+    if not path.is_file():
+        sys.exit("No database at {}".format(path))
+    connection = connect_sqlite(str(path))
+    migrate(connection)
+    return connection
+
+
+def sync(connection, args):
+    from miru.sync import synchronize
+
+    peer = _open_peer(args.peers[0])
+    try:
+        result = synchronize(connection, peer)
+    finally:
+        peer.close()
+    print(
+        "Sent {} and received {} changes, {} conflicts".format(
+            result.sent, result.received, result.conflicts
+        )
+    )
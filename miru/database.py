@@ -0,0 +1,150 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import sqlite3
+from configparser import ConfigParser
+from pathlib import Path
+
+DEFAULT_DATABASE = str(Path("~/.miru.db").expanduser())
+DEFAULT_CONFIG = str(Path("~/.miru.conf").expanduser())
+
+# Pragmas applied to every new connection. "fast" is meant for large
+# libraries on local disks: the write-ahead log turns commits into appends
+# and lets other processes read while Miru writes, and with it a NORMAL
+# synchronous level is still safe against corruption. WAL needs shared memory
+# and does not work on network file systems, so "network" keeps a rollback
+# journal, which needs FULL syncing to survive a power loss, and only gets
+# the larger cache. "safe" leaves SQLite's defaults alone.
+# The journal mode is stored in the database file, so the default has to be
+# one that works wherever the file might live and WAL is left to opt into.
+PROFILES = {
+    "safe": {},
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,
+        "temp_store": "MEMORY",
+    },
+    "network": {
+        "journal_mode": "TRUNCATE",
+        "synchronous": "FULL",
+        "mmap_size": 0,
+        "cache_size": -64 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+
+DEFAULT_PROFILE = "network"
+
+PRAGMAS = ("journal_mode", "synchronous", "mmap_size", "cache_size", "temp_store")
+
+_PRAGMA_VALUE = re.compile(r"^-?\w+$")
+
+
+def read_config(path=DEFAULT_CONFIG, section="database"):
+    """Read a section of a configuration file such as:
+
+        [database]
+        path = ~/.miru.db
+        profile = fast
+        cache_size = -131072
+
+        [interface]
+        catalog = ~/titles.csv
+
+    Missing files and sections result in an empty configuration."""
+    parser = ConfigParser()
+    parser.read(str(Path(path).expanduser()))
+    if not parser.has_section(section):
+        return {}
+    return dict(parser.items(section))
+
+
+def profile_pragmas(profile, overrides=None):
+    if profile not in PROFILES:
+        raise ValueError("Unknown database profile: {}".format(profile))
+    pragmas = dict(PROFILES[profile])
+    for name, value in (overrides or {}).items():
+        if name in PRAGMAS:
+            pragmas[name] = value
+    for name, value in pragmas.items():
+        if not _PRAGMA_VALUE.match(str(value)):
+            raise ValueError("Invalid value for {}: {}".format(name, value))
+    return pragmas
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        try:
+            cursor.execute("PRAGMA {} = {}".format(name, value))
+        except sqlite3.OperationalError:
+            # Leaving the write-ahead log takes the database to itself. While
+            # others have it open the mode is left for a later connection to
+            # change.
+            if name != "journal_mode":
+                raise
+    cursor.close()
+
+
+def set_pragmas(engine, pragmas):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, _connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
+
+
+def connect_database(path, memory=False, pragmas=None):
+    # SQLAlchemy is imported here so that commands working on a plain sqlite3
+    # connection do not have to load it.
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import SingletonThreadPool, StaticPool
+
+    # Every thread keeps a connection of its own instead of connecting and
+    # setting the pragmas again for each statement. An in-memory database
+    # only exists within its connection, so there the interface's database
+    # thread has to share the one connection, which it only does while the
+    # main thread leaves the database alone.
+    if memory:
+        engine = create_engine(
+            "sqlite://",
+            poolclass=StaticPool,
+            connect_args={"check_same_thread": False},
+        )
+    else:
+        engine = create_engine(
+            "sqlite:///%s" % str(Path(path).absolute()),
+            poolclass=SingletonThreadPool,
+        )
+    if pragmas:
+        set_pragmas(engine, pragmas)
+    return engine
+
+
+def connect_sqlite(path, memory=False, pragmas=None, threaded=False):
+    """Open a plain sqlite3 connection, for commands that only run a few
+    statements and would spend most of their time importing SQLAlchemy.
+    A `threaded` connection may be handed over to another thread."""
+    connection = sqlite3.connect(
+        ":memory:" if memory else str(Path(path).absolute()),
+        check_same_thread=not threaded,
+    )
+    if pragmas:
+        apply_pragmas(connection, pragmas)
+    return connection
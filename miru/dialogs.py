@@ -0,0 +1,173 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The dialog for adding series, with completion of names.
+
+from datetime import datetime
+
+import urwid
+
+
+class AddSeriesDialog(urwid.Overlay):
+    """Dialog for adding a series.
+
+    Names of existing series and catalog titles starting with what has been
+    typed are listed below the fields. Up and down pick one of them and
+    enter fills in its name and episode count. Adding a series with the same
+    name as an existing one has to be confirmed by pressing Add again."""
+
+    signals = ["closed"]
+    selected = 0
+    max_completions = 6
+
+    def __init__(self, background, status, store, writer):
+        self.store = store
+        self.writer = writer
+        self.status = status
+        self.completions = []
+        self.chosen = None
+        self.duplicates = []
+        self.confirmed = False
+        self.name_edit = urwid.AttrWrap(urwid.Edit(), "edit")
+        self.episode_edit = urwid.AttrWrap(urwid.IntEdit(), "edit")
+        self.add_button = urwid.AttrWrap(
+            urwid.Button("Add", self.add_button_click), "button"
+        )
+        self.tab_index = [self.name_edit, self.episode_edit, self.add_button]
+        self.content = urwid.GridFlow(
+            [
+                urwid.Text("Name"),
+                self.name_edit,
+                urwid.Text("Episodes"),
+                self.episode_edit,
+                self.add_button,
+            ],
+            20,
+            1,
+            1,
+            "center",
+        )
+        self.suggestions = urwid.Text("", wrap="clip")
+        self.notice = urwid.Text("")
+        urwid.connect_signal(self.name_edit.original_widget, "postchange", self.typed)
+        linebox = urwid.AttrWrap(
+            urwid.LineBox(
+                urwid.Filler(
+                    urwid.Pile(
+                        [self.content, urwid.Divider(), self.suggestions, self.notice]
+                    ),
+                    "top",
+                ),
+                "Add Series",
+            ),
+            "dialog",
+        )
+        self.select()
+        super().__init__(
+            linebox, background, "center", 50, "middle", 12 + self.max_completions
+        )
+
+    def select(self):
+        self.content.set_focus(self.tab_index[self.selected])
+
+    def typed(self, _edit, _old):
+        name = self.name_edit.get_edit_text()
+        names = self.store.names
+        self.confirmed = False
+        self.chosen = None
+        if names is None or not name.strip():
+            self.completions = []
+            self.duplicates = []
+        else:
+            self.completions = names.complete(name, self.max_completions)
+            self.duplicates = names.existing(name)
+        self.show_completions()
+        self.show_duplicates()
+
+    def show_completions(self):
+        lines = []
+        for index, completion in enumerate(self.completions):
+            line = completion.name
+            if completion.episodes:
+                line += " ({})".format(completion.episodes)
+            if completion.series is not None:
+                line += ", added"
+            if lines:
+                lines.append("\n")
+            lines.append(("highlight", line) if index == self.chosen else line)
+        self.suggestions.set_text(lines or "")
+
+    def show_duplicates(self):
+        if not self.duplicates:
+            self.notice.set_text("")
+            return
+        series = self.duplicates[0]
+        text = "Already added with {}/{} seen".format(series.seen, series.episodes)
+        if self.confirmed:
+            text += ", press Add again to add anyway"
+        self.notice.set_text(text)
+
+    def choose(self, step):
+        if not self.completions:
+            return
+        if self.chosen is None:
+            self.chosen = 0 if step > 0 else len(self.completions) - 1
+        else:
+            self.chosen = (self.chosen + step) % len(self.completions)
+        self.show_completions()
+
+    def complete(self):
+        completion = self.completions[self.chosen]
+        self.name_edit.set_edit_text(completion.name)
+        self.name_edit.set_edit_pos(len(completion.name))
+        if completion.episodes:
+            self.episode_edit.set_edit_text(str(completion.episodes))
+
+    def add_button_click(self, _widget):
+        if self.duplicates and not self.confirmed:
+            self.confirmed = True
+            self.show_duplicates()
+            return
+        self.add_series(
+            self.name_edit.get_edit_text(), 0, self.episode_edit.value() or 1
+        )
+        urwid.emit_signal(self, "closed")
+
+    def keypress(self, size, key):
+        if self.selected == 0 and key in ("up", "down"):
+            self.choose(1 if key == "down" else -1)
+            return None
+        if self.selected == 0 and key == "enter" and self.chosen is not None:
+            self.complete()
+            return None
+        if key == "tab":
+            self.selected = (self.selected + 1) % len(self.tab_index)
+            self.select()
+        if key == "esc":
+            urwid.emit_signal(self, "closed")
+            return None
+        return urwid.Overlay.keypress(self, size, key)
+
+    def add_series(self, name, seen, episodes):
+        seen = episodes if self.status == "completed" else seen
+        status = None if self.status in (None, "completed") else self.status
+        self.writer.add(
+            name=name,
+            episodes=episodes,
+            seen=seen,
+            status=status,
+            added=datetime.now(),
+        )
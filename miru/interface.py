@@ -15,11 +15,18 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import sys
-import urwid
+from datetime import date
 
-from sqlalchemy import and_, func
+import urwid
 
-from miru.models import Series
+from miru.dialogs import AddSeriesDialog
+from miru.listing import SeriesWalker
+from miru.rules import ADD_VIEWS, REMOVE_VIEWS, SET_SEEN, SET_STATUS
+from miru.statistics import StatisticsView, recent_days, recent_months
+from miru.store import SeriesStore, changed_ids
+from miru.trace import startup
+from miru.transfer import read_catalog
+from miru.worker import DatabaseWorker
 
 
 class MainWindow:
@@ -35,44 +42,47 @@ class MainWindow:
         ("edit", "white", "dark gray"),
         ("button", "white", "dark blue"),
         ("dialog", "black", "light gray"),
+        ("statistics", "white", "dark magenta"),
+        ("match", "black", "yellow"),
+        ("selected", "black", "light cyan"),
+        ("selected focus", "black", "dark cyan"),
     ]
     frame = None
 
-    def __init__(self, session):
+    def __init__(self, engine, flush_delay=0, refresh_interval=0, catalog=None):
+        store = SeriesStore(engine)
+        worker = DatabaseWorker()
+        writer = CommitScheduler(store, flush_delay, worker)
+        urwid.connect_signal(writer, "status_changed", self.show_status)
         self.views = [
-            View(
-                "Currently Watching",
-                "current",
-                None,
-                session,
-                # pylint: disable=C0121
-                and_(Series.seen < Series.episodes, Series.status == None),
-            ),
-            View(
-                "Completed",
-                "completed",
-                "completed",
-                session,
-                Series.seen == Series.episodes,
-            ),  # ugly
-            View("On Hold", "hold", "hold", session, Series.status == "hold"),
-            View("Dropped", "dropped", "dropped", session, Series.status == "dropped"),
-            View(
-                "Plan to Watch",
-                "planned",
-                "planned",
-                session,
-                Series.status == "planned",
-            ),
+            View("Currently Watching", "current", None, store, writer, "is_current"),
+            View("Completed", "completed", "completed", store, writer, "is_completed"),
+            View("On Hold", "hold", "hold", store, writer, "is_on_hold"),
+            View("Dropped", "dropped", "dropped", store, writer, "is_dropped"),
+            View("Plan to Watch", "planned", "planned", store, writer, "is_planned"),
         ]
         for view in self.views:
             urwid.connect_signal(view, "ordering_changed", self.ordering_changed)
+            urwid.connect_signal(view, "view_requested", self.view_requested)
+        startup.mark("build views")
         self.current = 0
-        self.session = session
+        self.store = store
+        self.worker = worker
+        self.writer = writer
+        self.refresh_interval = refresh_interval
+        self.catalog = catalog
+        store.revision = store.current_revision()
         self.display_view(self.current)
+        startup.mark("load {} view".format(self.views[self.current].attr))
         self.loop = urwid.MainLoop(
-            self.frame, self.palette, unhandled_input=self.unhandled_input
+            self.frame,
+            self.palette,
+            unhandled_input=self.unhandled_input,
+            input_filter=self.coalesce_input,
         )
+        writer.loop = self.loop
+        self.idle_handle = None
+        self.started = False
 
     def unhandled_input(self, key):
         if key in ("q", "Q"):
@@ -90,10 +100,56 @@ class MainWindow:
                 self.display_view(int(key) - 1)
             elif key == "a":
                 self.show_add_series_dialog()
+            elif key == "r":
+                self.store.recount()
+                self.views[self.current].redraw_totals()
+            elif key == "t" and not self.displaying_statistics:
+                self.show_statistics()
+            elif key in ("t", "esc") and self.displaying_statistics:
+                self.display_view(self.current)
+
+    def show_statistics(self):
+        # Flushing first makes the statistics include the latest changes.
+        self.writer.flush()
+        today = date.today()
+        days = recent_days(today, StatisticsView.days)
+        months = recent_months(today, StatisticsView.months)
+        statistics = self.worker.call(self.store.statistics, days[0], months[0])
+        set_terminal_title("Miru - Statistics")
+        self.frame.set_body(StatisticsView(statistics, days, months))
+
+    def coalesce_input(self, keys, _raw):
+        # Holding down i or d delivers runs of them in one batch. These are
+        # turned into a count of the net change, so that the change is made
+        # and written once instead of once for every key.
+        body = self.frame.get_body()
+        if (
+            len(keys) > 1
+            and isinstance(body, View)
+            and body.taking_commands
+            and all(key in ("i", "d") for key in keys)
+        ):
+            delta = keys.count("i") - keys.count("d")
+            if delta == 0:
+                return []
+            return list(str(abs(delta))) + ["i" if delta > 0 else "d"]
+        return keys
+
+    def view_requested(self, index):
+        if 0 <= index < len(self.views):
+            self.display_view(index)
 
     def show_add_series_dialog(self):
+        if self.store.names is None:
+            criteria = self.store.unloaded()
+            if criteria:
+                self.store.fill(criteria, self.worker.call(self.store.query, criteria))
+            self.index_names(wait=True)
         dialog = AddSeriesDialog(
-            self.views[self.current], self.views[self.current].status, self.session
+            self.views[self.current],
+            self.views[self.current].status,
+            self.store,
+            self.writer,
         )
         urwid.connect_signal(dialog, "closed", self.add_series_dialog_closed)
         self.frame.set_body(dialog)
@@ -107,7 +163,11 @@ class MainWindow:
         self.views[self.current].reload()
 
     def display_view(self, index):
+        self.writer.flush()
         self.current = index
+        criteria = self.store.unloaded([self.views[index].criterion])
+        if criteria:
+            self.store.fill(criteria, self.worker.call(self.store.query, criteria))
         self.views[index].reload()
         set_terminal_title("Miru - {}".format(self.views[index].title))
         if self.frame:
@@ -115,34 +175,285 @@ class MainWindow:
         else:
             self.frame = urwid.Frame(self.views[index])
 
+    def show_status(self, text):
+        self.frame.set_footer(
+            urwid.AttrWrap(urwid.Text(text), "highlight") if text else None
+        )
+
     @property
     def displaying_dialog(self):
         return isinstance(self.frame.get_body(), AddSeriesDialog)
 
+    @property
+    def displaying_statistics(self):
+        return isinstance(self.frame.get_body(), StatisticsView)
+
+    def first_idle(self):
+        # Only the displayed view is loaded before the loop starts. The rest
+        # are queried on the database worker once the first frame is out, one
+        # view at a time so that input is handled in between filling them.
+        if self.started:
+            return
+        self.started = True
+        self.loop.draw_screen()
+        startup.frame_drawn()
+        self.load_next_view()
+        self.schedule_refresh()
+
+    def load_next_view(self):
+        criteria = self.store.unloaded()[:1]
+        if criteria:
+            self.worker.submit(
+                self.store.query,
+                criteria,
+                callback=lambda future: self.view_loaded(criteria, future),
+            )
+        else:
+            startup.mark("load other views")
+            if self.store.names is None:
+                self.index_names()
+
+    def index_names(self, wait=False):
+        # The names of the series are indexed for completing them once all
+        # of the series have been loaded.
+        if not self.catalog:
+            self.store.index_names()
+            return
+        future = self.worker.submit(
+            read_catalog, self.catalog, callback=None if wait else self.catalog_read
+        )
+        if wait:
+            self.catalog_read(future)
+
+    def catalog_read(self, future):
+        titles = ()
+        if future.exception() is not None:
+            self.show_status(
+                "Reading the catalog failed: {}".format(describe(future.exception()))
+            )
+        else:
+            titles = future.result()
+        self.store.index_names(titles)
+
+    def view_loaded(self, criteria, future):
+        if self.idle_handle is not None:
+            self.loop.event_loop.remove_enter_idle(self.idle_handle)
+            self.idle_handle = None
+        if future.exception() is not None:
+            self.show_status("Loading failed: {}".format(describe(future.exception())))
+            return
+        self.store.fill(criteria, future.result())
+        self.load_next_view()
+
+    def schedule_refresh(self):
+        if self.refresh_interval > 0:
+            self.loop.set_alarm_in(self.refresh_interval, self.refresh)
+
+    def refresh(self, _loop, _data):
+        # Picks up changes that other processes have committed.
+        self.worker.submit(
+            self.store.changes_since,
+            self.store.data_version,
+            self.store.revision,
+            callback=self.refreshed,
+        )
+
+    def refreshed(self, future):
+        if future.exception() is not None:
+            self.show_status(
+                "Refreshing failed: {}".format(describe(future.exception()))
+            )
+        else:
+            self.store.refresh(future.result())
+        self.schedule_refresh()
+
     def main(self):
-        self.loop.run()
+        """Run the interface until it is quit. Returns the last failure to
+        save, if saving failed at any point."""
+        self.idle_handle = self.loop.event_loop.enter_idle(self.first_idle)
+        self.worker.start(self.loop)
+        try:
+            self.loop.run()
+        finally:
+            failure = self.writer.close()
+        return failure
 
 
 def set_terminal_title(title):
     sys.stdout.write("\x1b]2;{}\x07".format(title))
 
 
-class View(urwid.WidgetWrap):
-    signals = ["ordering_changed"]
+def describe(error):
+    # SQLAlchemy's messages include the whole statement and its parameters.
+    return str(getattr(error, "orig", error))
+
+
+class CommitScheduler:
+    """Write-behind committing of the store's changes.
+
+    Changes are kept in the store and committed in a single transaction once
+    no new edits have arrived for `delay` seconds. The commits run on the
+    database worker while the interface goes on with the changes already
+    applied. If a commit fails, the series it touched are put back to how
+    they are in the database. The status line says "Saving…" while commits
+    are underway and tells about failures."""
+
+    signals = ["status_changed"]
+
+    def __init__(self, store, delay, worker):
+        self.store = store
+        self.delay = delay
+        self.worker = worker
+        self.loop = None
+        self.alarm = None
+        self.saving = 0
+        self.error = None
+        self.failure = None
+
+    def commit(self):
+        if self.loop is None or self.delay <= 0:
+            self.flush()
+            return
+        if self.alarm:
+            self.loop.remove_alarm(self.alarm)
+        self.alarm = self.loop.set_alarm_in(self.delay, self._alarm_expired)
+
+    def _alarm_expired(self, _loop, _data):
+        self.alarm = None
+        self.flush()
+
+    def flush(self):
+        if self.alarm:
+            self.loop.remove_alarm(self.alarm)
+            self.alarm = None
+        if not self.store.pending:
+            return None
+        changes = self.store.take_changes()
+        ids = changed_ids(changes)
+        return self._submit(
+            self.store.write,
+            changes,
+            callback=lambda future: self._written(ids, future),
+        )
+
+    def update_all(self, series, change, assignments, **params):
+        """Apply `change` to each of the series right away and write all of
+        them with one set-based UPDATE of `assignments` from miru.rules,
+        which has to do the same to the rows. Pending changes are written
+        first, on the same worker, so the rows are as the series were before
+        the change. The rows are read back once written, which brings the
+        series up to date with whatever others changed."""
+        self.flush()
+        ids = self.store.change_all(series, change)
+        self._submit(
+            self.store.update_all,
+            ids,
+            assignments,
+            params,
+            callback=lambda future: self._written(ids, future),
+        )
+
+    def delete_all(self, series):
+        self.flush()
+        ids = self.store.remove_all(series)
+        self._submit(
+            self.store.delete_all,
+            ids,
+            callback=lambda future: self._written(ids, future),
+        )
+
+    def add(self, **values):
+        self._submit(
+            self.store.insert,
+            values,
+            callback=lambda future: self._inserted(values, future),
+        )
+
+    def _submit(self, function, *args, callback):
+        self.saving += 1
+        if self.saving == 1:
+            urwid.emit_signal(self, "status_changed", "Saving…")
+        return self.worker.submit(function, *args, callback=callback)
+
+    def _written(self, ids, future):
+        # Writes return the rows as they were written.
+        failed = future.exception() is not None
+        self.store.written(ids, () if failed else future.result() or ())
+        if failed:
+            self.error = "Saving failed ({}), changes were reverted".format(
+                describe(future.exception())
+            )
+            # The reverted changes are lost whatever is saved later, so the
+            # failure is kept for the exit status.
+            self.failure = self.error
+            self.worker.submit(
+                self.store.fetch,
+                ids,
+                callback=lambda fetched: self._fetched(ids, fetched),
+            )
+        self._finished()
+
+    def _fetched(self, ids, future):
+        if future.exception() is not None:
+            urwid.emit_signal(
+                self,
+                "status_changed",
+                "Saving failed and reverting changes failed too ({})".format(
+                    describe(future.exception())
+                ),
+            )
+            return
+        self.store.restore(ids, future.result())
+
+    def _inserted(self, values, future):
+        if future.exception() is None:
+            self.store.added(future.result(), values)
+        else:
+            self.error = "Adding {} failed ({})".format(
+                values["name"], describe(future.exception())
+            )
+        self._finished()
+
+    def _finished(self):
+        self.saving -= 1
+        if not self.saving:
+            urwid.emit_signal(self, "status_changed", self.error)
+            self.error = None
+
+    def close(self):
+        """Commit what is left and wait for the worker to finish. Returns
+        the last failure to save, if saving failed at any point."""
+        self.flush()
+        self.worker.stop()
+        return self.failure
+
+
+urwid.register_signal(CommitScheduler, CommitScheduler.signals)
+
+
+class View(urwid.WidgetWrap):  # pylint: disable=R0904
+    signals = ["ordering_changed", "view_requested"]
+
+    max_count = 9999
 
     _order_by_active = False
+    _marking = False
+    _marking_selected = False
+    _going = False
+    count = 0
 
-    def __init__(self, title, attr, status, session, filter_):
+    def __init__(self, title, attr, status, store, writer, criterion):
         self.title = title
         self.attr = attr
         self.status = status
-        self.session = session
-        self.filter = filter_
+        self.store = store
+        self.writer = writer
+        self.criterion = criterion
         self.header = None
         self.body = None
         self.footer = None
-        self.walker = SeriesWalker(session, filter_)
-        urwid.connect_signal(self.walker, "series_changed", self.redraw_footer)
+        self.walker = SeriesWalker(store, writer, criterion)
+        urwid.connect_signal(self.walker, "series_changed", self.redraw_totals)
         urwid.connect_signal(self.walker, "marking_activated", self.marking_activated)
         urwid.connect_signal(self.walker, "marking_deactivated", self.redraw_footer)
         urwid.connect_signal(self.walker, "deletion_requested", self.handle_delete)
@@ -155,6 +466,7 @@ class View(urwid.WidgetWrap):
         self.reload()
 
     def marking_activated(self):
+        self._marking = True
         self.footer = urwid.AttrWrap(
             urwid.Text(
                 [
@@ -196,7 +508,7 @@ class View(urwid.WidgetWrap):
         self.refresh()
 
     def handle_order_by(self, key):
-        keys = {"n": Series.name, "s": Series.seen, "e": Series.episodes}
+        keys = {"n": "name", "s": "seen", "e": "episodes"}
         self._order_by_active = False
         self.redraw_footer()
         if key in keys.keys():
@@ -205,18 +517,210 @@ class View(urwid.WidgetWrap):
         return key
 
     def redraw_footer(self):
+        self._marking = False
         self._w.set_focus("body")
         self.setup_footer()
         self.refresh()
 
+    def redraw_totals(self):
+        self.setup_header()
+        if self.prompting:
+            # The footer is left to the prompt or menu until it is closed.
+            self._w.set_header(self.header)
+        else:
+            self.redraw_footer()
+
+    @property
+    def prompting(self):
+        return (
+            self._w.focus_position == "footer"
+            or self._order_by_active
+            or self._marking
+            or self._marking_selected
+        )
+
     def keypress(self, size, key):
         if self._order_by_active:
             return self.handle_order_by(key)
+        if self._marking_selected:
+            self.handle_marking_selected(key)
+            return None
+        if self._w.focus_position != "body":
+            return self._w.keypress(size, key)
+        if not self._marking and self.handle_prefix(key):
+            return None
+        if self.handle_command(size, key):
+            return None
+        key = self._w.keypress(size, key)
+        if self.walker.anchor is not None:
+            # The selected range follows the focus.
+            self.redraw_footer()
+        return key
+
+    @property
+    def taking_commands(self):
+        """Whether keys are taken as commands, as opposed to being typed to a
+        prompt or completing a command."""
+        return self._w.focus_position == "body" and not (
+            self._order_by_active
+            or self._marking
+            or self._marking_selected
+            or self._going
+            or self.count
+        )
+
+    def handle_prefix(self, key):
+        # Counts for i and d, and g followed by a number for moving to a view.
+        going, self._going = self._going, False
+        digit = len(key) == 1 and key in "0123456789"
+        if going and digit:
+            urwid.emit_signal(self, "view_requested", int(key) - 1)
+            return True
+        if key == "g":
+            # A count does not carry over to the view moved to, or back.
+            self._going = True
+            if self.count:
+                self.count = 0
+                self.redraw_footer()
+            return True
+        if digit and (self.count or key != "0"):
+            self.count = min(10 * self.count + int(key), self.max_count)
+            self.redraw_footer()
+            return True
+        count, self.count = self.count, 0
+        if count and key in ("i", "d"):
+            if self.walker.selecting:
+                self.handle_selected(key, count)
+            else:
+                self.change_focused(key, count)
+            return True
+        if count:
+            self.redraw_footer()
+        return False
+
+    def change_focused(self, key, count):
+        series = self.walker.focused_series()
+        if series is None:
+            self.redraw_footer()
+            return
+        if key == "i":
+            self.store.edit(series, lambda item: item.add_view(count))
+        else:
+            self.store.edit(series, lambda item: item.remove_view(count))
+        self.writer.commit()
+
+    def handle_command(self, size, key):
         if key == "o":
             self._order_by_active = True
             self.order_by_activated()
-            return None
-        return self._w.keypress(size, key)
+            return True
+        if key == "/":
+            self.start_search()
+            return True
+        if key == "esc" and not self.walker.selecting and self.walker.query:
+            self.search_cancelled()
+            return True
+        if key == " ":
+            self.walker.toggle_selected()
+            self._w.keypress(size, "down")
+        elif key == "V":
+            self.walker.toggle_range()
+        elif key == "esc" and self.walker.selecting:
+            self.walker.clear_selection()
+        elif key in ("i", "d", "m", "s", "x") and self.walker.selecting:
+            self.handle_selected(key)
+            return True
+        else:
+            return False
+        self.redraw_footer()
+        return True
+
+    def handle_selected(self, key, count=1):
+        series = self.walker.selected_series()
+        if key == "i":
+            self.change_selected(
+                series, lambda item: item.add_view(count), ADD_VIEWS, count=count
+            )
+        elif key == "d":
+            self.change_selected(
+                series, lambda item: item.remove_view(count), REMOVE_VIEWS, count=count
+            )
+        elif key == "m":
+            self._marking_selected = True
+            self.marking_activated()
+        elif key == "s":
+            self.show_input(
+                IntPrompt(
+                    "Set the number of seen episodes for {} series: ".format(
+                        len(series)
+                    )
+                ),
+                self.set_seen_selected,
+                series,
+            )
+        else:
+            self.show_input(
+                Prompt(
+                    "Do you really want to delete {} series [y/N]?: ".format(
+                        len(series)
+                    )
+                ),
+                self.delete_selected,
+                series,
+            )
+
+    def handle_marking_selected(self, key):
+        keys = {"a": None, "h": "hold", "d": "dropped", "p": "planned"}
+        self._marking_selected = False
+        if key in keys:
+            status = keys[key]
+
+            def mark(series):
+                series.status = status
+
+            self.change_selected(
+                self.walker.selected_series(), mark, SET_STATUS, status=status
+            )
+        else:
+            self.redraw_footer()
+
+    def set_seen_selected(self, number, series):
+        self.change_selected(
+            series, lambda item: item.set_seen(number), SET_SEEN, count=number
+        )
+
+    def delete_selected(self, text, series):
+        if text.lower() == "y":
+            self.walker.clear_selection()
+            with self.walker.batch():
+                self.writer.delete_all(series)
+        self.redraw_footer()
+
+    def change_selected(self, series, change, assignments, **params):
+        self.walker.clear_selection()
+        with self.walker.batch():
+            self.writer.update_all(series, change, assignments, **params)
+        self.redraw_footer()
+
+    def start_search(self):
+        prompt = Prompt("/", self.walker.query)
+        urwid.connect_signal(prompt, "postchange", self.search_changed)
+        urwid.connect_signal(prompt, "input_received", self.search_received)
+        urwid.connect_signal(prompt, "input_cancelled", self.search_cancelled)
+        self.footer = urwid.AttrWrap(prompt, self.attr)
+        self._w.set_focus("footer")
+        self.refresh()
+
+    def search_changed(self, prompt, _old_text):
+        self.walker.search(prompt.get_edit_text())
+        self.refresh()
+
+    def search_received(self, _text):
+        self.redraw_footer()
+
+    def search_cancelled(self):
+        self.walker.search("")
+        self.redraw_footer()
 
     def show_input(self, widget, callback, *args):
         def wrapper(*signal_args):
@@ -238,9 +742,8 @@ class View(urwid.WidgetWrap):
 
     def delete_confirmation(self, text, series):
         if text.lower() == "y":
-            self.session.delete(series)
-            self.session.commit()
-            self.reload()
+            self.store.delete(series)
+            self.writer.commit()
         else:
             self.redraw_footer()
 
@@ -252,9 +755,8 @@ class View(urwid.WidgetWrap):
         )
 
     def set_seen_confirmation(self, number, series):
-        series.seen = number if number <= series.episodes else series.episodes
-        self.session.commit()
-        self.reload()
+        self.store.edit(series, lambda item: item.set_seen(number))
+        self.writer.commit()
 
     def refresh(self):
         self._w.set_body(self.body)
@@ -266,14 +768,17 @@ class View(urwid.WidgetWrap):
         self.refresh()
 
     def set_ordering(self, ordering):
-        self.walker.order_by = ordering
+        self.walker.set_ordering(ordering)
 
     def setup_header(self):
         self.header = urwid.AttrWrap(
             urwid.Columns(
                 [
                     ("weight", 0.1, urwid.Text("<")),
-                    urwid.Text(self.title, "center"),
+                    urwid.Text(
+                        "{} ({})".format(self.title, self.walker.totals.count),
+                        "center",
+                    ),
                     ("weight", 0.1, urwid.Text(">", "right")),
                 ]
             ),
@@ -286,13 +791,21 @@ class View(urwid.WidgetWrap):
         )
 
     def setup_footer(self):
-        self.footer = urwid.AttrWrap(
-            urwid.Text(
-                "Total of {} seen episodes".format(self.walker.total_seen_episodes),
-                "center",
-            ),
-            self.attr,
+        totals = self.walker.totals
+        text = "Total of {} seen episodes out of {} ({:.0f}%)".format(
+            totals.seen, totals.episodes, totals.completion
         )
+        if self.walker.query:
+            text = '{} matching "{}" (esc to clear) · {}'.format(
+                len(self.walker.matches), self.walker.query, text
+            )
+        if self.walker.selecting:
+            text = "{} selected: i, d, m, s and x apply to all, esc to clear".format(
+                len(self.walker.selected_series())
+            )
+        if self.count:
+            text = "{} times: i or d".format(self.count)
+        self.footer = urwid.AttrWrap(urwid.Text(text, "center"), self.attr)
 
     def setup_widgets(self):
         self.setup_header()
@@ -326,155 +839,6 @@ class SeriesTable(DataTable):
         )
 
 
-class SeriesWalker:
-    def __init__(self, session, filter_):
-        self.session = session
-        self.filter = filter_
-        self.order_by = Series.name
-        self.focus = 0
-        self.reload()
-
-    def reload(self):
-        self.data = (
-            self.session.query(Series).filter(self.filter).order_by(self.order_by).all()
-        )
-        self.entries = [
-            urwid.AttrMap(w, None, "reveal focus")
-            for w in map(self._create_entry, self.data)
-        ]
-        urwid.emit_signal(self, "series_changed")
-
-    def _create_entry(self, series):
-        entry = SeriesEntry(self.session, series)
-        urwid.connect_signal(entry, "series_changed", self.reload)
-        re_emit = (
-            "marking_activated",
-            "marking_deactivated",
-            "deletion_requested",
-            "setting_seen_requested",
-        )
-        for signal in re_emit:
-            urwid.connect_signal(entry, signal, self.re_emit, signal)
-        return entry
-
-    def _clamp_focus(self):
-        if self.focus >= len(self.entries):
-            self.focus = len(self.entries) - 1
-
-    def get_focus(self):
-        if not self.entries:
-            return (None, None)
-        self._clamp_focus()
-        return (self.entries[self.focus], self.focus)
-
-    def get_next(self, position):
-        next_position = position + 1
-        if len(self.entries) <= next_position:
-            return (None, None)
-        return (self.entries[next_position], next_position)
-
-    def get_prev(self, position):
-        prev_position = position - 1
-        if prev_position < 0:
-            return (None, None)
-        return self.entries[prev_position], prev_position
-
-    def set_focus(self, position):
-        self.focus = position
-
-    def re_emit(self, *args):
-        if len(args) >= 2:
-            urwid.emit_signal(self, args[-1], *args[0:-1])
-        else:
-            urwid.emit_signal(self, args[-1])
-
-    @property
-    def total_seen_episodes(self):
-        return (
-            self.session.query(func.sum(Series.seen)).filter(self.filter).one()[0] or 0
-        )
-
-
-urwid.register_signal(
-    SeriesWalker,
-    [
-        "series_changed",
-        "marking_activated",
-        "marking_deactivated",
-        "deletion_requested",
-        "setting_seen_requested",
-    ],
-)
-
-
-class SeriesEntry(urwid.WidgetWrap):
-    signals = [
-        "series_changed",
-        "marking_activated",
-        "marking_deactivated",
-        "deletion_requested",
-        "setting_seen_requested",
-    ]
-
-    _marking_active = False
-
-    def __init__(self, session, series):
-        self.session = session
-        self.series = series
-        self.name = urwid.Text(self.series.name, wrap="clip")
-        self.seen = urwid.Text(str(self.series.seen), align="right")
-        self.episodes = urwid.Text(str(self.series.episodes), align="right")
-        super().__init__(
-            urwid.Columns(
-                [
-                    ("weight", 0.6, self.name),
-                    ("weight", 0.2, self.seen),
-                    ("weight", 0.2, self.episodes),
-                ]
-            )
-        )
-
-    def selectable(self):
-        return True
-
-    def handle_marking(self, key):
-        keys = {
-            "a": None,  # mark as active
-            "h": "hold",  # mark as on hold
-            "d": "dropped",  # mark as dropped
-            "p": "planned",  # mark as planned
-        }
-        self._marking_active = False
-        urwid.emit_signal(self, "marking_deactivated")
-        if key in keys.keys():
-            self.series.status = keys[key]
-            self.session.commit()
-            urwid.emit_signal(self, "series_changed")
-            return None
-        return key
-
-    def keypress(self, _size, key):
-        if self._marking_active:
-            return self.handle_marking(key)
-        if key in ("i", "d"):
-            if key == "i":
-                self.series.add_view()
-            else:
-                self.series.remove_view()
-            self.session.commit()  # Maybe we should commit only after some time
-            urwid.emit_signal(self, "series_changed")
-        elif key == "m":
-            urwid.emit_signal(self, "marking_activated")
-            self._marking_active = True
-        elif key == "s":
-            urwid.emit_signal(self, "setting_seen_requested", self.series)
-        elif key == "x":
-            urwid.emit_signal(self, "deletion_requested", self.series)
-        else:
-            return key
-        return None
-
-
 class VimStyleListBox(urwid.ListBox):
     """ListBox that changes focus with j and k keys and supports mouse wheel scrolling"""
 
@@ -517,60 +881,3 @@ class IntPrompt(Prompt):
 
     def valid_char(self, ch):
         return len(ch) == 1 and ch in "0123456789"
-
-
-class AddSeriesDialog(urwid.Overlay):
-    signals = ["closed"]
-    selected = 0
-
-    def __init__(self, background, status, session):
-        self.session = session
-        self.status = status
-        self.name_edit = urwid.AttrWrap(urwid.Edit(), "edit")
-        self.episode_edit = urwid.AttrWrap(urwid.IntEdit(), "edit")
-        self.add_button = urwid.AttrWrap(
-            urwid.Button("Add", self.add_button_click), "button"
-        )
-        self.tab_index = [self.name_edit, self.episode_edit, self.add_button]
-        self.content = urwid.GridFlow(
-            [
-                urwid.Text("Name"),
-                self.name_edit,
-                urwid.Text("Episodes"),
-                self.episode_edit,
-                self.add_button,
-            ],
-            20,
-            1,
-            1,
-            "center",
-        )
-        linebox = urwid.AttrWrap(
-            urwid.LineBox(urwid.Filler(self.content), "Add Series"), "dialog"
-        )
-        self.select()
-        super().__init__(linebox, background, "center", 50, "middle", 12)
-
-    def select(self):
-        self.content.set_focus(self.tab_index[self.selected])
-
-    def add_button_click(self, _widget):
-        self.add_series(
-            self.name_edit.get_edit_text(), 0, self.episode_edit.get_edit_text()
-        )
-        urwid.emit_signal(self, "closed")
-
-    def keypress(self, size, key):
-        if key == "tab":
-            self.selected = (self.selected + 1) % len(self.tab_index)
-            self.select()
-        if key == "esc":
-            urwid.emit_signal(self, "closed")
-            return None
-        return urwid.Overlay.keypress(self, size, key)
-
-    def add_series(self, name, seen, episodes):
-        seen = episodes if self.status == "completed" else seen
-        status = None if self.status in (None, "completed") else self.status
-        self.session.add(Series(name=name, episodes=episodes, seen=seen, status=status))
-        self.session.commit()
@@ -0,0 +1,407 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The list of series shown in a view: a list walker over one of the store's
+# buckets and the widgets of its rows.
+
+from contextlib import contextmanager
+
+import urwid
+
+from miru.models import Series
+from miru.store import Matches
+
+
+class SeriesWalker:
+    """List walker over one of the store's buckets.
+
+    List positions are the bucket's sort keys. Widgets are created only for
+    the rows the list box actually asks for and are dropped again once they
+    end up far away from the focus.
+
+    A search narrows the walker down to the series whose names contain the
+    query. The matches of every prefix of the query are kept while typing,
+    so that each key only has to filter the previous matches and deleting
+    characters goes back to earlier matches without searching again.
+
+    Series can be selected one by one and in ranges. The range runs from
+    the anchor set when it was started to the focus, wherever it moves.
+
+    Dropped widgets are kept in a pool and given to the next series that
+    needs one instead of building new ones."""
+
+    max_entries = 500
+    max_pooled = 250
+
+    def __init__(self, store, writer, criterion):
+        self.store = store
+        self.writer = writer
+        self.bucket = store.bucket(criterion)
+        self.bucket.listeners.append(self.series_moved)
+        self.focus = None
+        self.entries = {}
+        self.pool = []
+        self.query = ""
+        self.searches = []
+        self.matches = None
+        self.names = None
+        self.selected = set()
+        self.anchor = None
+        self.batching = False
+
+    @property
+    def shown(self):
+        return self.bucket if self.matches is None else self.matches
+
+    def reload(self):
+        focused = self.bucket.get(self.focus) if self.focus is not None else None
+        self.bucket.apply_order()
+        for _query, matches in self.searches:
+            matches.rebuild()
+        if self.anchor is not None:
+            self.anchor = self.bucket.key_of(self.anchor[-1])
+        if focused is not None:
+            self.focus = self.bucket.key_of(focused.id)
+        if self.focus is None or self.shown.get(self.focus) is None:
+            self.focus = self.shown.first()
+        urwid.emit_signal(self, "series_changed")
+
+    def search(self, query):
+        query = query.lower()
+        self.query = query
+        while self.searches and not query.startswith(self.searches[-1][0]):
+            self.searches.pop()
+        if not query:
+            self.matches = None
+            self.names = None
+        else:
+            if not self.searches or self.searches[-1][0] != query:
+                self.searches.append((query, self._search(query)))
+            self.matches = self.searches[-1][1]
+        if self.focus is None or self.shown.get(self.focus) is None:
+            self.focus = self.shown.first()
+
+    def _search(self, query):
+        if self.names is None:
+            self.names = {
+                series.id: series.name.lower() for series in self.bucket.rows.values()
+            }
+        names = self.names
+        if self.searches:
+            return self.searches[-1][1].narrow(names, query)
+        ids = {series_id for series_id, name in names.items() if query in name}
+        return Matches.of(self.bucket, ids)
+
+    def set_ordering(self, ordering):
+        self.bucket.set_order(ordering)
+
+    def focused_series(self):
+        return self.shown.get(self.focus) if self.focus is not None else None
+
+    @property
+    def selecting(self):
+        return bool(self.selected) or self.anchor is not None
+
+    def _range(self):
+        if self.anchor is None or self.focus is None:
+            return []
+        return self.shown.between(*sorted((self.anchor, self.focus)))
+
+    def selected_series(self):
+        keys = {self.bucket.key_of(series_id) for series_id in self.selected}
+        keys.update(self._range())
+        keys.discard(None)
+        return [self.bucket.get(key) for key in sorted(keys) if self.shown.get(key)]
+
+    def toggle_selected(self):
+        if self.focus is not None:
+            self.selected.symmetric_difference_update([self.focus[-1]])
+            self._restyle()
+
+    def toggle_range(self):
+        if self.anchor is None:
+            self.anchor = self.focus
+        else:
+            self.selected.update(key[-1] for key in self._range())
+            self.anchor = None
+        self._restyle()
+
+    def clear_selection(self):
+        self.selected = set()
+        self.anchor = None
+        self._restyle()
+
+    def _style(self, entry, key):
+        selected = key[-1] in self.selected or (
+            self.anchor is not None
+            and self.focus is not None
+            and min(self.anchor, self.focus) <= key <= max(self.anchor, self.focus)
+        )
+        attr = "selected" if selected else None
+        if entry.attr_map[None] != attr:
+            entry.set_attr_map({None: attr})
+            entry.set_focus_map(
+                {None: "selected focus" if selected else "reveal focus"}
+            )
+
+    def _restyle(self):
+        for series_id, entry in self.entries.items():
+            key = self.bucket.key_of(series_id)
+            if key is not None:
+                self._style(entry, key)
+
+    @contextmanager
+    def batch(self):
+        """Signal the changes to any number of series made within as one."""
+        self.batching = True
+        try:
+            yield
+        finally:
+            self.batching = False
+        urwid.emit_signal(self, "series_changed")
+
+    def series_moved(self, series, old_key, new_key):
+        if self.names is not None:
+            name = series.name.lower()
+            if new_key is None:
+                self.names.pop(series.id, None)
+            else:
+                self.names[series.id] = name
+            for query, matches in self.searches:
+                matches.sync(old_key, new_key if query in name else None)
+            if self.query not in name:
+                new_key = None
+        if new_key is None:
+            self.selected.discard(series.id)
+        if old_key is not None and old_key == self.anchor:
+            self.anchor = new_key
+        if old_key is not None and old_key == self.focus:
+            self.focus = new_key if new_key is not None else self.shown.nearest(old_key)
+        entry = self.entries.get(series.id)
+        if entry is not None:
+            if new_key is None:
+                self._release(series.id)
+            else:
+                entry.original_widget.update()
+        if not self.batching:
+            urwid.emit_signal(self, "series_changed")
+
+    def _create_entry(self, series):
+        if self.pool:
+            entry = self.pool.pop()
+            entry.original_widget.bind(series, self.query)
+            return entry
+        entry = SeriesEntry(self.writer, series, self.query)
+        urwid.connect_signal(entry, "change_requested", self.store.edit)
+        re_emit = (
+            "marking_activated",
+            "marking_deactivated",
+            "deletion_requested",
+            "setting_seen_requested",
+        )
+        for signal in re_emit:
+            urwid.connect_signal(entry, signal, self.re_emit, signal)
+        return urwid.AttrMap(entry, None, "reveal focus")
+
+    def _release(self, series_id):
+        entry = self.entries.pop(series_id)
+        if len(self.pool) < self.max_pooled:
+            self.pool.append(entry)
+
+    def _entry(self, key):
+        series = self.bucket.get(key)
+        entry = self.entries.get(series.id)
+        if entry is None:
+            if len(self.entries) >= self.max_entries:
+                self._evict()
+            entry = self._create_entry(series)
+            self.entries[series.id] = entry
+        elif entry.original_widget.highlight != self.query:
+            entry.original_widget.bind(series, self.query)
+        self._style(entry, key)
+        return (entry, key)
+
+    def _evict(self):
+        shown = self.shown
+        center = shown.index(self.focus)
+        reach = self.max_entries // 4
+        for series_id in list(self.entries):
+            key = self.bucket.key_of(series_id)
+            if (
+                key is None
+                or shown.get(key) is None
+                or abs(shown.index(key) - center) > reach
+            ):
+                self._release(series_id)
+
+    def get_focus(self):
+        if self.focus is None:
+            self.focus = self.shown.first()
+            if self.focus is None:
+                return (None, None)
+        return self._entry(self.focus)
+
+    def get_next(self, position):
+        key = self.shown.next(position)
+        if key is None:
+            return (None, None)
+        return self._entry(key)
+
+    def get_prev(self, position):
+        key = self.shown.prev(position)
+        if key is None:
+            return (None, None)
+        return self._entry(key)
+
+    def set_focus(self, position):
+        self.focus = position
+
+    def re_emit(self, *args):
+        if len(args) >= 2:
+            urwid.emit_signal(self, args[-1], *args[0:-1])
+        else:
+            urwid.emit_signal(self, args[-1])
+
+    @property
+    def totals(self):
+        return self.bucket.totals
+
+
+urwid.register_signal(
+    SeriesWalker,
+    [
+        "series_changed",
+        "marking_activated",
+        "marking_deactivated",
+        "deletion_requested",
+        "setting_seen_requested",
+    ],
+)
+
+
+class SeriesEntry(urwid.WidgetWrap):
+    signals = [
+        "change_requested",
+        "marking_activated",
+        "marking_deactivated",
+        "deletion_requested",
+        "setting_seen_requested",
+    ]
+
+    _marking_active = False
+
+    def __init__(self, writer, series, highlight=""):
+        self.writer = writer
+        self.series = series
+        self.highlight = highlight
+        self.shown = None
+        self.canvas = None
+        self.name = urwid.Text("", wrap="clip")
+        self.seen = urwid.Text("", align="right")
+        self.episodes = urwid.Text("", align="right")
+        self.update()
+        super().__init__(
+            urwid.Columns(
+                [
+                    ("weight", 0.6, self.name),
+                    ("weight", 0.2, self.seen),
+                    ("weight", 0.2, self.episodes),
+                ]
+            )
+        )
+
+    def bind(self, series, highlight):
+        """Show another series, or the same one with another highlight."""
+        self.series = series
+        self.highlight = highlight
+        self._marking_active = False
+        self.update()
+
+    def update(self):
+        name = self.series.name
+        start = name.lower().find(self.highlight) if self.highlight else -1
+        shown = (
+            name,
+            start,
+            len(self.highlight),
+            self.series.seen,
+            self.series.episodes,
+        )
+        if shown == self.shown:
+            return
+        old = self.shown or (None, None, None, None, None)
+        self.shown = shown
+        self.canvas = None
+        if shown[:3] != old[:3]:
+            if start < 0:
+                self.name.set_text(name)
+            else:
+                end = start + len(self.highlight)
+                self.name.set_text(
+                    [name[:start], ("match", name[start:end]), name[end:]]
+                )
+        if shown[3] != old[3]:
+            self.seen.set_text(str(self.series.seen))
+        if shown[4] != old[4]:
+            self.episodes.set_text(str(self.series.episodes))
+
+    def render(self, size, focus=False):
+        # Urwid only keeps weak references to rendered canvases, so they are
+        # usually gone by the next redraw. Keeping the last one around lets
+        # rows that have not changed skip laying out their columns again.
+        if self.canvas is None or self.canvas[0] != (size, focus):
+            self.canvas = ((size, focus), super().render(size, focus))
+        return self.canvas[1]
+
+    def selectable(self):
+        return True
+
+    def handle_marking(self, key):
+        keys = {
+            "a": None,  # mark as active
+            "h": "hold",  # mark as on hold
+            "d": "dropped",  # mark as dropped
+            "p": "planned",  # mark as planned
+        }
+        self._marking_active = False
+        urwid.emit_signal(self, "marking_deactivated")
+        if key in keys.keys():
+
+            def mark(series):
+                series.status = keys[key]
+
+            urwid.emit_signal(self, "change_requested", self.series, mark)
+            self.writer.commit()
+            return None
+        return key
+
+    def keypress(self, _size, key):
+        if self._marking_active:
+            return self.handle_marking(key)
+        if key in ("i", "d"):
+            change = Series.add_view if key == "i" else Series.remove_view
+            urwid.emit_signal(self, "change_requested", self.series, change)
+            self.writer.commit()
+        elif key == "m":
+            urwid.emit_signal(self, "marking_activated")
+            self._marking_active = True
+        elif key == "s":
+            urwid.emit_signal(self, "setting_seen_requested", self.series)
+        elif key == "x":
+            urwid.emit_signal(self, "deletion_requested", self.series)
+        else:
+            return key
+        return None
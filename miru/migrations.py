@@ -0,0 +1,381 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Schema migrations. The schema version is kept in SQLite's user_version
+# pragma, which is zero both for new files and for databases created by
+# older versions of Miru. Migrations are written out as plain DDL instead of
+# being derived from the models, since they describe how the schema looked
+# at each version. New migrations are only ever appended to MIGRATIONS.
+# They are always run on a plain sqlite3 connection, also when Miru
+# otherwise goes through SQLAlchemy.
+
+
+def create_series_table(connection):
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS series (
+            id INTEGER NOT NULL,
+            name VARCHAR(64) NOT NULL,
+            episodes INTEGER,
+            seen INTEGER,
+            added DATETIME,
+            completed DATETIME,
+            status VARCHAR(7),
+            PRIMARY KEY (id),
+            CHECK (status IN ('hold', 'dropped', 'planned'))
+        )
+        """
+    )
+
+
+def create_view_indexes(connection):
+    # The views filtering on status are served by (status, column) indexes,
+    # and the completed view, which is the only one comparing two columns,
+    # gets partial indexes. Together with the implicit rowid these cover the
+    # filter and the (column, id) ordering of every view.
+    for column in ("name", "seen", "episodes"):
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS ix_series_status_{0} "
+            "ON series (status, {0})".format(column)
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS ix_series_completed_{0} "
+            "ON series ({0}) WHERE seen = episodes".format(column)
+        )
+
+
+def create_name_index(connection):
+    # Looking series up by name, e.g. when importing with upserts.
+    connection.execute("CREATE INDEX IF NOT EXISTS ix_series_name ON series (name)")
+
+
+def add_revisions(connection):
+    # Every change to a series takes the next number from a counter and
+    # deleted series leave tombstones behind, so that a connection can fetch
+    # just what others changed since it last looked. Triggers keep these up
+    # to date whoever does the writing, including older versions of Miru.
+    connection.execute(
+        "ALTER TABLE series ADD COLUMN revision INTEGER NOT NULL DEFAULT 0"
+    )
+    connection.execute("CREATE INDEX ix_series_revision ON series (revision)")
+    connection.execute("CREATE TABLE series_revision (value INTEGER NOT NULL)")
+    connection.execute("INSERT INTO series_revision (value) VALUES (0)")
+    connection.execute(
+        """
+        CREATE TABLE series_tombstones (
+            id INTEGER NOT NULL,
+            revision INTEGER NOT NULL,
+            PRIMARY KEY (id)
+        )
+        """
+    )
+    connection.execute(
+        "CREATE INDEX ix_series_tombstones_revision ON series_tombstones (revision)"
+    )
+    connection.execute(
+        """
+        CREATE TRIGGER series_inserted AFTER INSERT ON series
+        BEGIN
+            UPDATE series_revision SET value = value + 1;
+            UPDATE series SET revision = (SELECT value FROM series_revision)
+                WHERE id = NEW.id;
+            DELETE FROM series_tombstones WHERE id = NEW.id;
+        END
+        """
+    )
+    # Listing the columns keeps the trigger's own update of the revision
+    # from firing it again.
+    connection.execute(
+        """
+        CREATE TRIGGER series_updated
+        AFTER UPDATE OF name, episodes, seen, added, completed, status ON series
+        BEGIN
+            UPDATE series_revision SET value = value + 1;
+            UPDATE series SET revision = (SELECT value FROM series_revision)
+                WHERE id = NEW.id;
+        END
+        """
+    )
+    connection.execute(
+        """
+        CREATE TRIGGER series_deleted AFTER DELETE ON series
+        BEGIN
+            UPDATE series_revision SET value = value + 1;
+            INSERT OR REPLACE INTO series_tombstones (id, revision)
+                VALUES (OLD.id, (SELECT value FROM series_revision));
+        END
+        """
+    )
+
+
+def add_watch_history(connection):
+    # Every change of a seen count is logged as an event in the same
+    # transaction as the change, and the events are summed up per day and
+    # per month as they come in, so statistics never scan the log. The
+    # completed column of an event is 1 when the change completed the series
+    # and -1 when it made a completed series incomplete again.
+    connection.execute(
+        """
+        CREATE TABLE watch_events (
+            id INTEGER NOT NULL,
+            series_id INTEGER NOT NULL,
+            watched_at DATETIME NOT NULL,
+            episodes INTEGER NOT NULL,
+            completed INTEGER NOT NULL,
+            PRIMARY KEY (id)
+        )
+        """
+    )
+    connection.execute(
+        "CREATE INDEX ix_watch_events_series_id ON watch_events (series_id)"
+    )
+    for table, period in (("watch_daily", "day"), ("watch_monthly", "month")):
+        connection.execute(
+            """
+            CREATE TABLE {0} (
+                {1} VARCHAR(10) NOT NULL,
+                episodes INTEGER NOT NULL,
+                completed INTEGER NOT NULL,
+                PRIMARY KEY ({1})
+            )
+            """.format(
+                table, period
+            )
+        )
+    connection.execute(
+        """
+        CREATE TRIGGER series_watched AFTER UPDATE OF seen ON series
+        WHEN NEW.seen != OLD.seen
+        BEGIN
+            INSERT INTO watch_events (series_id, watched_at, episodes, completed)
+                VALUES (
+                    NEW.id,
+                    datetime('now', 'localtime'),
+                    NEW.seen - OLD.seen,
+                    (NEW.seen >= NEW.episodes) - (OLD.seen >= OLD.episodes)
+                );
+        END
+        """
+    )
+    connection.execute(
+        """
+        CREATE TRIGGER watch_event_added AFTER INSERT ON watch_events
+        BEGIN
+            INSERT OR IGNORE INTO watch_daily (day, episodes, completed)
+                VALUES (date(NEW.watched_at), 0, 0);
+            UPDATE watch_daily
+                SET episodes = episodes + NEW.episodes,
+                    completed = completed + NEW.completed
+                WHERE day = date(NEW.watched_at);
+            INSERT OR IGNORE INTO watch_monthly (month, episodes, completed)
+                VALUES (strftime('%Y-%m', NEW.watched_at), 0, 0);
+            UPDATE watch_monthly
+                SET episodes = episodes + NEW.episodes,
+                    completed = completed + NEW.completed
+                WHERE month = strftime('%Y-%m', NEW.watched_at);
+        END
+        """
+    )
+
+
+def add_sync(connection):
+    # Synchronizing databases needs ids that are the same in all of them, so
+    # every series gets a random one, along with the time it last changed
+    # for resolving conflicts. Deleted series leave tombstones with these
+    # ids behind. The series' revisions tell what changed since a peer was
+    # last synchronized with, up to the revision of the peer's that is
+    # stored in sync_peers.
+    # Series last changed before revisions were added are still at zero,
+    # which would leave them out of the first synchronization.
+    connection.execute("UPDATE series_revision SET value = value + 1")
+    connection.execute(
+        "UPDATE series SET revision = (SELECT value FROM series_revision) "
+        "WHERE revision = 0"
+    )
+    connection.execute("CREATE TABLE sync_identity (uid TEXT NOT NULL)")
+    connection.execute(
+        "INSERT INTO sync_identity (uid) VALUES (lower(hex(randomblob(16))))"
+    )
+    connection.execute(
+        """
+        CREATE TABLE sync_series (
+            id INTEGER NOT NULL,
+            uid TEXT NOT NULL,
+            updated TEXT NOT NULL,
+            PRIMARY KEY (id)
+        )
+        """
+    )
+    connection.execute(
+        "INSERT INTO sync_series (id, uid, updated) "
+        "SELECT id, lower(hex(randomblob(16))), datetime('now') FROM series"
+    )
+    connection.execute("CREATE UNIQUE INDEX ix_sync_series_uid ON sync_series (uid)")
+    connection.execute(
+        """
+        CREATE TABLE sync_tombstones (
+            uid TEXT NOT NULL,
+            revision INTEGER NOT NULL,
+            deleted TEXT NOT NULL,
+            PRIMARY KEY (uid)
+        )
+        """
+    )
+    connection.execute(
+        "CREATE INDEX ix_sync_tombstones_revision ON sync_tombstones (revision)"
+    )
+    connection.execute(
+        """
+        CREATE TABLE sync_peers (
+            peer TEXT NOT NULL,
+            revision INTEGER NOT NULL,
+            PRIMARY KEY (peer)
+        )
+        """
+    )
+    connection.execute(
+        """
+        CREATE TRIGGER sync_series_inserted AFTER INSERT ON series
+        BEGIN
+            INSERT INTO sync_series (id, uid, updated)
+                VALUES (NEW.id, lower(hex(randomblob(16))), datetime('now'));
+        END
+        """
+    )
+    connection.execute(
+        """
+        CREATE TRIGGER sync_series_updated
+        AFTER UPDATE OF name, episodes, seen, added, completed, status ON series
+        BEGIN
+            UPDATE sync_series SET updated = datetime('now') WHERE id = NEW.id;
+        END
+        """
+    )
+    # The order of triggers is not defined, so the tombstone takes a new
+    # revision of its own instead of the one series_deleted takes.
+    connection.execute(
+        """
+        CREATE TRIGGER sync_series_deleted AFTER DELETE ON series
+        BEGIN
+            UPDATE series_revision SET value = value + 1;
+            INSERT OR REPLACE INTO sync_tombstones (uid, revision, deleted)
+                SELECT uid, (SELECT value FROM series_revision), datetime('now')
+                FROM sync_series WHERE id = OLD.id;
+            DELETE FROM sync_series WHERE id = OLD.id;
+        END
+        """
+    )
+
+
+def normalize_counts(connection):
+    # Older versions stored the episode count as typed, so a blank field left
+    # an empty string behind. SQL compares those with numbers regardless, but
+    # the view predicates of miru.models.Series do not. Converting the counts
+    # is not watching anything, so series_watched is left out meanwhile.
+    (trigger,) = connection.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' "
+        "AND name = 'series_watched'"
+    ).fetchone()
+    connection.execute("DROP TRIGGER series_watched")
+    for column, default in (("episodes", 1), ("seen", 0)):
+        connection.execute(
+            "UPDATE series SET {0} = CASE WHEN trim({0}) GLOB '[0-9]*' "
+            "AND trim({0}) NOT GLOB '*[^0-9]*' THEN CAST(trim({0}) AS INTEGER) "
+            "ELSE {1} END WHERE typeof({0}) != 'integer'".format(column, default)
+        )
+    connection.execute(trigger)
+
+
+def add_watch_pause(connection):
+    # Changes of seen counts that were not watched here, such as ones
+    # synchronized from another database, are written while watch_paused
+    # has a row, which keeps series_watched from logging them.
+    connection.execute("CREATE TABLE watch_paused (reason TEXT NOT NULL)")
+    connection.execute("DROP TRIGGER series_watched")
+    connection.execute(
+        """
+        CREATE TRIGGER series_watched AFTER UPDATE OF seen ON series
+        WHEN NEW.seen != OLD.seen AND NOT EXISTS (SELECT 1 FROM watch_paused)
+        BEGIN
+            INSERT INTO watch_events (series_id, watched_at, episodes, completed)
+                VALUES (
+                    NEW.id,
+                    datetime('now', 'localtime'),
+                    NEW.seen - OLD.seen,
+                    (NEW.seen >= NEW.episodes) - (OLD.seen >= OLD.episodes)
+                );
+        END
+        """
+    )
+
+
+MIGRATIONS = [
+    create_series_table,
+    create_view_indexes,
+    create_name_index,
+    add_revisions,
+    add_watch_history,
+    add_sync,
+    normalize_counts,
+    add_watch_pause,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(connection):
+    """Apply the missing migrations to a plain sqlite3 connection. The module
+    would commit before every DDL statement on its own, so the migrations run
+    in a transaction of their own. It takes the write lock up front, so a
+    Miru starting at the same time waits and then finds the work done."""
+    version = schema_version(connection)
+    if version == SCHEMA_VERSION:
+        return
+    isolation_level = connection.isolation_level
+    connection.isolation_level = None
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(connection)
+            if version > SCHEMA_VERSION:
+                raise RuntimeError(
+                    "Database schema version {} is newer than the supported "
+                    "version {}".format(version, SCHEMA_VERSION)
+                )
+            for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+                migration(connection)
+                connection.execute("PRAGMA user_version = {}".format(number))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    finally:
+        connection.isolation_level = isolation_level
+
+
+def upgrade(engine):
+    """Bring the database up to the latest schema version."""
+    # SQLAlchemy's pysqlite dialect leaves beginning transactions to the
+    # sqlite3 module, so the migrations work on the connection under it.
+    connection = engine.raw_connection()
+    try:
+        migrate(connection.connection)
+    finally:
+        connection.close()
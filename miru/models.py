@@ -14,28 +14,137 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, DateTime, Integer, String, Enum
+from sqlalchemy import Column, DateTime, Enum, Integer, MetaData, String, Table, and_
 
-Base = declarative_base()
+from miru.rules import STATUSES
 
+metadata = MetaData()
 
-class Series(Base):
-    __tablename__ = "series"
-    id = Column(Integer, primary_key=True)
-    name = Column(String(64), nullable=False)
-    episodes = Column(Integer, default=1)
-    seen = Column(Integer, default=0)
-    added = Column(DateTime())
-    completed = Column(DateTime())
-    status = Column(Enum("hold", "dropped", "planned"))
+# The table is declared with SQLAlchemy Core only. The ORM and its
+# declarative extension take a good while to import and Miru never tracks
+# objects through a session, so they are not used at all.
+series_table = Table(
+    "series",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(64), nullable=False),
+    Column("episodes", Integer, default=1),
+    Column("seen", Integer, default=0),
+    Column("added", DateTime()),
+    Column("completed", DateTime()),
+    Column("status", Enum(*STATUSES)),
+    # Maintained by triggers, see miru.migrations.add_revisions.
+    Column("revision", Integer, nullable=False, default=0),
+)
 
-    def add_view(self):
+revision_table = Table(
+    "series_revision", metadata, Column("value", Integer, nullable=False)
+)
+
+tombstones_table = Table(
+    "series_tombstones",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("revision", Integer, nullable=False),
+)
+
+# Written by triggers, see miru.migrations.add_watch_history.
+watch_events_table = Table(
+    "watch_events",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("series_id", Integer, nullable=False),
+    Column("watched_at", DateTime(), nullable=False),
+    Column("episodes", Integer, nullable=False),
+    Column("completed", Integer, nullable=False),
+)
+
+daily_table = Table(
+    "watch_daily",
+    metadata,
+    Column("day", String(10), primary_key=True),
+    Column("episodes", Integer, nullable=False),
+    Column("completed", Integer, nullable=False),
+)
+
+monthly_table = Table(
+    "watch_monthly",
+    metadata,
+    Column("month", String(10), primary_key=True),
+    Column("episodes", Integer, nullable=False),
+    Column("completed", Integer, nullable=False),
+)
+
+columns = series_table.c
+
+# SQL counterparts of the view predicates of Series, keyed by the predicate
+# names in miru.rules.VIEW_CRITERIA.
+CRITERIA = {
+    # pylint: disable=C0121
+    "is_current": and_(columns.seen < columns.episodes, columns.status == None),
+    "is_completed": columns.seen == columns.episodes,
+    "is_on_hold": columns.status == "hold",
+    "is_dropped": columns.status == "dropped",
+    "is_planned": columns.status == "planned",
+}
+
+
+class Series:
+    """Plain, untracked copy of a row of the series table.
+
+    Besides the column values a series knows which views it belongs to and
+    the rules for counting episodes, so the interface can apply changes and
+    tell where a changed series goes without querying the database. CRITERIA
+    and miru.rules have the same rules as SQL and must be kept in line with
+    this class."""
+
+    # pylint: disable=E1101,E0203,W0201
+    __slots__ = tuple(column.key for column in series_table.c)
+
+    def __init__(self, **values):
+        for field in self.__slots__:
+            setattr(self, field, values.get(field))
+
+    @classmethod
+    def from_row(cls, row):
+        """Series from the values of all columns of the table in order."""
+        series = cls.__new__(cls)
+        for field, value in zip(cls.__slots__, row):
+            setattr(series, field, value)
+        return series
+
+    def values(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @property
+    def is_current(self):
+        return self.seen < self.episodes and self.status is None
+
+    @property
+    def is_completed(self):
+        return self.seen == self.episodes
+
+    @property
+    def is_on_hold(self):
+        return self.status == "hold"
+
+    @property
+    def is_dropped(self):
+        return self.status == "dropped"
+
+    @property
+    def is_planned(self):
+        return self.status == "planned"
+
+    def add_view(self, count=1):
         if self.episodes > self.seen:
-            self.seen += 1
+            self.seen = min(self.seen + count, self.episodes)
             if self.status:
                 self.status = None
 
-    def remove_view(self):
+    def remove_view(self, count=1):
         if self.seen > 0:
-            self.seen -= 1
+            self.seen = max(self.seen - count, 0)
+
+    def set_seen(self, seen):
+        self.seen = min(seen, self.episodes)
@@ -0,0 +1,202 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+from pathlib import Path
+
+import urwid
+from sqlalchemy import event
+
+from miru.interface import MainWindow, View
+from miru.listing import SeriesEntry
+
+# Methods timed on their own, besides the end-to-end latency of actions.
+HANDLERS = [
+    (MainWindow, "unhandled_input"),
+    (View, "keypress"),
+    (SeriesEntry, "keypress"),
+]
+
+SLOWEST_STATEMENTS = 20
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latencies(values):
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 0.5) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": max(values) * 1000,
+    }
+
+
+class Profiler:
+    """Where the time of user actions goes.
+
+    An action starts when the main loop receives input and ends once the
+    screen has been drawn after it, so its latency includes rendering.
+    Queries are counted and timed per action, including those that the
+    action left for the database worker. Work the worker does on its own,
+    such as delayed commits, is accounted to the name of the job instead.
+    With `overlay`, the cost of the last action is shown above the view."""
+
+    def __init__(self, overlay=False):
+        self.overlay = overlay
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.actions = defaultdict(list)
+        self.handlers = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.current = None
+        self.started = None
+        self.window = None
+
+    def install(self, engine):
+        """Start timing queries and handlers. Has to be called before the
+        main window is created."""
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+        for cls, name in HANDLERS:
+            method = getattr(cls, name)
+            setattr(cls, name, self._timed(method, "{}.{}".format(cls.__name__, name)))
+
+    def attach(self, window):
+        self.window = window
+        window.worker.wrapper = self._job
+        loop = window.loop
+        loop.process_input = self._input(loop.process_input)
+        loop.draw_screen = self._drawn(loop.draw_screen)
+
+    def _timed(self, method, name):
+        @wraps(method)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.handlers[name].append(time.perf_counter() - start)
+
+        return timed
+
+    def _input(self, process_input):
+        @wraps(process_input)
+        def received(keys):
+            if self.current is None:
+                self.current = " ".join(
+                    key if isinstance(key, str) else key[0] for key in keys
+                )
+                self.started = time.perf_counter()
+            return process_input(keys)
+
+        return received
+
+    def _drawn(self, draw_screen):
+        @wraps(draw_screen)
+        def drawn():
+            draw_screen()
+            if self.current is None:
+                return
+            action, self.current = self.current, None
+            latency = time.perf_counter() - self.started
+            self.actions[action].append(latency)
+            if self.overlay:
+                with self.lock:
+                    queries = self.queries.get(action, ())
+                    count = sum(1 for query in queries if query[2] >= self.started)
+                self.window.frame.set_header(
+                    urwid.AttrWrap(
+                        urwid.Text(
+                            "{}: {:.1f} ms, {} queries".format(
+                                action, latency * 1000, count
+                            )
+                        ),
+                        "highlight",
+                    )
+                )
+                draw_screen()
+
+        return drawn
+
+    def _job(self, function):
+        # Called on the main thread when a job is submitted to the worker.
+        action = self.current or "worker: {}".format(function.__name__)
+
+        @wraps(function)
+        def job(*args):
+            self.local.action = action
+            try:
+                return function(*args)
+            finally:
+                self.local.action = None
+
+        return job
+
+    def _before_execute(self, _conn, _cursor, _statement, _params, context, _many):
+        context.profiling_started = time.perf_counter()
+
+    def _after_execute(self, _conn, _cursor, statement, _params, context, _many):
+        now = time.perf_counter()
+        action = getattr(self.local, "action", None) or self.current or "startup"
+        with self.lock:
+            self.queries[action].append(
+                (statement, now - context.profiling_started, context.profiling_started)
+            )
+
+    def summary(self):
+        with self.lock:
+            queries = {action: list(items) for action, items in self.queries.items()}
+        actions = {}
+        for action in set(self.actions) | set(queries):
+            times = self.actions.get(action, [])
+            statements = queries.get(action, [])
+            summary = latencies(times) if times else {"count": 0}
+            summary["queries"] = len(statements)
+            summary["queries_per_action"] = len(statements) / max(1, len(times))
+            summary["query_ms"] = sum(query[1] for query in statements) * 1000
+            actions[action] = summary
+        slowest = sorted(
+            (
+                (elapsed, statement, action)
+                for action, statements in queries.items()
+                for statement, elapsed, _started in statements
+            ),
+            reverse=True,
+        )[:SLOWEST_STATEMENTS]
+        return {
+            "actions": actions,
+            "handlers": {
+                name: latencies(times) for name, times in self.handlers.items() if times
+            },
+            "slowest_statements": [
+                {"ms": elapsed * 1000, "action": action, "statement": statement}
+                for elapsed, statement, action in slowest
+            ],
+        }
+
+    def write(self, path):
+        Path(path).write_text(
+            json.dumps(self.summary(), indent=2, sort_keys=True) + "\n",
+            encoding="utf-8",
+        )
@@ -0,0 +1,80 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The status and episode counting rules of Series expressed as SQL, for
+# code that updates the series table directly instead of going through
+# loaded rows. This module must stay free of SQLAlchemy and urwid imports so
+# that the command line can use it without paying for them.
+
+from collections import OrderedDict
+
+STATUSES = ("hold", "dropped", "planned")
+
+# Columns series can be listed in the order of.
+ORDERS = ("name", "seen", "episodes")
+
+# Number of rows imported in one transaction.
+DEFAULT_BATCH_SIZE = 5000
+
+# Largest episode and seen count accepted on the way in, which is the
+# largest one the binary export format can store.
+MAX_COUNT = 2**32 - 1
+
+# Lists of ids and names are bound in chunks of this size to stay below
+# SQLite's default limit of 999 bound parameters.
+CHUNK_SIZE = 500
+
+# Names of the views and the predicates of Series selecting their series,
+# along with the same predicates as SQL.
+VIEW_CRITERIA = OrderedDict(
+    [
+        ("current", "is_current"),
+        ("completed", "is_completed"),
+        ("hold", "is_on_hold"),
+        ("dropped", "is_dropped"),
+        ("planned", "is_planned"),
+    ]
+)
+
+VIEW_FILTERS = {
+    "current": "seen < episodes AND status IS NULL",
+    "completed": "seen = episodes",
+    "hold": "status = 'hold'",
+    "dropped": "status = 'dropped'",
+    "planned": "status = 'planned'",
+}
+
+# Assignments for UPDATE statements. Like Series.add_view, adding views
+# stops at the episode count and makes a series active again if it was not
+# complete yet, and like remove_view, removing views stops at zero. Setting
+# the seen count caps it at the episode count. All of them take the number
+# of views or episodes as the :count parameter.
+ADD_VIEWS = (
+    "status = CASE WHEN seen < episodes THEN NULL ELSE status END, "
+    "seen = MAX(MIN(seen + :count, episodes), seen)"
+)
+
+REMOVE_VIEWS = "seen = MAX(seen - :count, 0)"
+
+SET_SEEN = "seen = MIN(:count, episodes)"
+
+SET_STATUS = "status = :status"
+
+
+def chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
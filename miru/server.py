@@ -0,0 +1,390 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# A long-running HTTP server exposing the series as JSON, for scripts that
+# would otherwise start the miru command over and over. Like the scripting
+# commands, it works on plain sqlite3 connections and changes series with
+# the rules of miru.rules:
+#
+#     GET    /series?view=current&order=name
+#     POST   /series                    {"name": ..., "episodes": ...}
+#     GET    /series/ID
+#     DELETE /series/ID
+#     POST   /series/ID/increment       {"count": 1}
+#     POST   /series/ID/decrement       {"count": 1}
+#     POST   /series/ID/seen            {"seen": 12}
+#     POST   /series/ID/mark            {"status": "hold"}
+#
+# Connections are kept alive between requests.
+
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import parse_qsl, quote, urlsplit
+
+from miru.rules import (
+    ADD_VIEWS,
+    MAX_COUNT,
+    REMOVE_VIEWS,
+    SET_SEEN,
+    ORDERS,
+    SET_STATUS,
+    STATUSES,
+    VIEW_FILTERS,
+)
+from miru.transfer import InvalidRow, validate
+
+COLUMNS = ("id", "name", "episodes", "seen", "status", "added", "completed")
+
+# The format SQLAlchemy stores dates in, which the interface expects to find.
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+MAX_BODY = 64 * 1024
+
+# The largest integer SQLite stores.
+MAX_ID = 2**63 - 1
+
+# Methods, paths and the names of the Server methods handling them. Groups
+# of the paths, which are series ids, are passed to the handlers as integers.
+ROUTES = [
+    (method, re.compile(path + "$"), handler)
+    for method, path, handler in (
+        ("GET", r"/series", "list_series"),
+        ("POST", r"/series", "add_series"),
+        ("GET", r"/series/(\d+)", "get_series"),
+        ("DELETE", r"/series/(\d+)", "delete_series"),
+        ("POST", r"/series/(\d+)/increment", "increment"),
+        ("POST", r"/series/(\d+)/decrement", "decrement"),
+        ("POST", r"/series/(\d+)/seen", "set_seen"),
+        ("POST", r"/series/(\d+)/mark", "mark"),
+    )
+]
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+class Database:
+    """Database access for the server's requests.
+
+    All changes are made with the one connection the server was started
+    with, on a thread of its own, so they never wait for each other's locks.
+    Reads are spread over a few read-only connections, each kept by a thread
+    of a pool, so that long listings do not hold up changes. An in-memory
+    database can only be reached through its own connection, so then reads
+    go through the writer too."""
+
+    def __init__(self, connection, readers):
+        self.connection = connection
+        self.local = threading.local()
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        path = connection.execute("PRAGMA database_list").fetchone()[2]
+        if path and readers > 0:
+            self.uri = "file:{}?mode=ro".format(quote(path))
+            self.readers = ThreadPoolExecutor(max_workers=readers)
+        else:
+            self.uri = None
+            self.readers = self.writer
+
+    def _reader(self):
+        if self.uri is None:
+            return self.connection
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.uri, uri=True)
+            self.local.connection = connection
+        return connection
+
+    def read(self, function, *args):
+        return asyncio.get_running_loop().run_in_executor(
+            self.readers, lambda: function(self._reader(), *args)
+        )
+
+    def write(self, function, *args):
+        def transaction():
+            with self.connection:
+                return function(self.connection, *args)
+
+        return asyncio.get_running_loop().run_in_executor(self.writer, transaction)
+
+    def close(self):
+        self.readers.shutdown(wait=True)
+        self.writer.shutdown(wait=True)
+
+
+def _series(row):
+    return dict(zip(COLUMNS, row))
+
+
+def _get(connection, series_id):
+    row = connection.execute(
+        "SELECT {} FROM series WHERE id = ?".format(", ".join(COLUMNS)), (series_id,)
+    ).fetchone()
+    if row is None:
+        raise HTTPError(HTTPStatus.NOT_FOUND, "No series with id {}".format(series_id))
+    return _series(row)
+
+
+def _update(connection, series_id, assignments, params):
+    cursor = connection.execute(
+        "UPDATE series SET {} WHERE id = :id".format(assignments),
+        dict(params, id=series_id),
+    )
+    if cursor.rowcount == 0:
+        raise HTTPError(HTTPStatus.NOT_FOUND, "No series with id {}".format(series_id))
+    return _get(connection, series_id)
+
+
+def _insert(connection, values):
+    for field in ("added", "completed"):
+        if values[field] is not None:
+            values[field] = values[field].strftime(DATETIME_FORMAT)
+    cursor = connection.execute(
+        "INSERT INTO series (name, episodes, seen, status, added, completed) "
+        "VALUES (:name, :episodes, :seen, :status, :added, :completed)",
+        values,
+    )
+    return _get(connection, cursor.lastrowid)
+
+
+def _delete(connection, series_id):
+    cursor = connection.execute("DELETE FROM series WHERE id = ?", (series_id,))
+    if cursor.rowcount == 0:
+        raise HTTPError(HTTPStatus.NOT_FOUND, "No series with id {}".format(series_id))
+
+
+def _count(body, field, default=None):
+    value = body.get(field, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise HTTPError(
+            HTTPStatus.BAD_REQUEST, "{} must be a non-negative integer".format(field)
+        )
+    if value > MAX_COUNT:
+        raise HTTPError(
+            HTTPStatus.BAD_REQUEST,
+            "{} can not be larger than {}".format(field, MAX_COUNT),
+        )
+    return value
+
+
+def _series_id(group):
+    series_id = int(group)
+    if series_id > MAX_ID:
+        raise HTTPError(
+            HTTPStatus.BAD_REQUEST, "Series ids are at most {}".format(MAX_ID)
+        )
+    return series_id
+
+
+class Server:
+    """Answers requests, reading and writing through a Database.
+
+    Listings of views are cached along with the revision of the series table
+    they were read at, and served from the cache until some connection,
+    whether the server's or another program's, changes the series."""
+
+    def __init__(self, database):
+        self.database = database
+        self.listings = {}
+
+    def _listing(self, connection, view, order):
+        revision = connection.execute("SELECT value FROM series_revision").fetchone()
+        cached = self.listings.get((view, order))
+        if cached is not None and cached[0] == revision:
+            return cached[1]
+        query = "SELECT {} FROM series".format(", ".join(COLUMNS))
+        if view is not None:
+            query += " WHERE " + VIEW_FILTERS[view]
+        query += " ORDER BY {}, id".format(order)
+        body = json.dumps([_series(row) for row in connection.execute(query)])
+        self.listings[(view, order)] = (revision, body)
+        return body
+
+    async def list_series(self, query, _body):
+        view = query.get("view")
+        order = query.get("order", "name")
+        if view is not None and view not in VIEW_FILTERS:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Unknown view: {}".format(view))
+        if order not in ORDERS:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Unknown order: {}".format(order))
+        return HTTPStatus.OK, await self.database.read(self._listing, view, order)
+
+    async def add_series(self, _query, body):
+        try:
+            values = validate(body)
+        except InvalidRow as error:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(error)) from error
+        if values["added"] is None:
+            values["added"] = datetime.now()
+        return HTTPStatus.CREATED, await self.database.write(_insert, values)
+
+    async def get_series(self, _query, _body, series_id):
+        return HTTPStatus.OK, await self.database.read(_get, series_id)
+
+    async def delete_series(self, _query, _body, series_id):
+        await self.database.write(_delete, series_id)
+        return HTTPStatus.NO_CONTENT, None
+
+    async def increment(self, _query, body, series_id):
+        count = _count(body, "count", 1)
+        return HTTPStatus.OK, await self.database.write(
+            _update, series_id, ADD_VIEWS, {"count": count}
+        )
+
+    async def decrement(self, _query, body, series_id):
+        count = _count(body, "count", 1)
+        return HTTPStatus.OK, await self.database.write(
+            _update, series_id, REMOVE_VIEWS, {"count": count}
+        )
+
+    async def set_seen(self, _query, body, series_id):
+        seen = _count(body, "seen")
+        return HTTPStatus.OK, await self.database.write(
+            _update, series_id, SET_SEEN, {"count": seen}
+        )
+
+    async def mark(self, _query, body, series_id):
+        status = body.get("status")
+        if status != "active" and status not in STATUSES:
+            raise HTTPError(
+                HTTPStatus.BAD_REQUEST,
+                "status must be one of active, {}".format(", ".join(STATUSES)),
+            )
+        status = None if status == "active" else status
+        return HTTPStatus.OK, await self.database.write(
+            _update, series_id, SET_STATUS, {"status": status}
+        )
+
+    async def dispatch(self, method, target, content):
+        url = urlsplit(target)
+        allowed = False
+        for route_method, pattern, handler in ROUTES:
+            match = pattern.match(url.path)
+            if match is None:
+                continue
+            allowed = True
+            if route_method != method:
+                continue
+            try:
+                body = json.loads(content.decode("utf-8")) if content else {}
+            except ValueError as error:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, str(error)) from error
+            if not isinstance(body, dict):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Expected a JSON object")
+            query = dict(parse_qsl(url.query))
+            ids = [_series_id(group) for group in match.groups()]
+            return await getattr(self, handler)(query, body, *ids)
+        if allowed:
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+        raise HTTPError(HTTPStatus.NOT_FOUND)
+
+    async def handle(self, reader, writer):
+        try:
+            while await self._respond(reader, writer):
+                pass
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, reader, writer):
+        request = await reader.readline()
+        if not request:
+            return False
+        headers = await _read_headers(reader)
+        version = "HTTP/1.1"
+        keep_alive = True
+        try:
+            method, target, version = request.decode("latin-1").split()
+            connection = headers.get("connection", "").lower()
+            if version == "HTTP/1.1":
+                keep_alive = connection != "close"
+            else:
+                keep_alive = connection == "keep-alive"
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY:
+                keep_alive = False
+                raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            content = await reader.readexactly(length)
+            status, result = await self.dispatch(method, target, content)
+        except HTTPError as error:
+            status, result = error.status, {"error": str(error)}
+        except sqlite3.OperationalError as error:
+            status, result = HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)}
+        except ValueError:
+            keep_alive = False
+            status, result = HTTPStatus.BAD_REQUEST, {"error": "Malformed request"}
+        writer.write(_response(version, status, result, keep_alive))
+        await writer.drain()
+        return keep_alive
+
+
+async def _read_headers(reader):
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            return headers
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+def _response(version, status, result, keep_alive):
+    # Listings come from the cache already encoded.
+    if result is None:
+        payload = b""
+    elif isinstance(result, str):
+        payload = result.encode("utf-8")
+    else:
+        payload = json.dumps(result).encode("utf-8")
+    head = [
+        "{} {} {}".format(version, status.value, status.phrase),
+        "Content-Length: {}".format(len(payload)),
+        "Connection: {}".format("keep-alive" if keep_alive else "close"),
+    ]
+    if payload:
+        head.append("Content-Type: application/json")
+    return "\r\n".join(head).encode("latin-1") + b"\r\n\r\n" + payload
+
+
+def serve(connection, args):
+    database = Database(connection, args.readers)
+    try:
+        asyncio.run(_main(Server(database), args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        database.close()
+
+
+async def _main(server, args):
+    if args.socket:
+        listener = await asyncio.start_unix_server(server.handle, args.socket)
+        address = args.socket
+    else:
+        listener = await asyncio.start_server(server.handle, args.host, args.port)
+        address = "http://{}:{}".format(args.host, args.port)
+    print("Serving on {}".format(address), flush=True)
+    async with listener:
+        await listener.serve_forever()
@@ -0,0 +1,99 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import timedelta
+
+import urwid
+
+
+def recent_days(today, count):
+    return [(today - timedelta(days=days)).isoformat() for days in range(count)][::-1]
+
+
+def recent_months(today, count):
+    months = []
+    year, month = today.year, today.month
+    for _ in range(count):
+        months.append("{:04d}-{:02d}".format(year, month))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return months[::-1]
+
+
+class StatisticsView(urwid.WidgetWrap):
+    """Episodes watched and series completed per day and per month, from
+    the rollups of the watch history."""
+
+    days = 14
+    months = 12
+
+    def __init__(self, statistics, days, months):
+        daily = [(day, statistics.days.get(day, (0, 0))) for day in days]
+        monthly = [(month, statistics.months.get(month, (0, 0))) for month in months]
+        watched = [episodes for _day, (episodes, _completed) in daily]
+        completed = sum(count for _month, (_episodes, count) in monthly)
+        summary = [
+            "Watched {} episodes today, {} in the last 7 days and {} this "
+            "month.".format(watched[-1], sum(watched[-7:]), monthly[-1][1][0]),
+            "{:.1f} episodes a day on average over the last {} days.".format(
+                sum(watched) / len(watched), len(watched)
+            ),
+            "Completed {} series in the last {} months, {:.1f} a month on "
+            "average.".format(completed, len(monthly), completed / len(monthly)),
+        ]
+        rows = [urwid.Text(line) for line in summary]
+        rows.extend(self.table("Day", daily))
+        rows.extend(self.table("Month", monthly))
+        header = urwid.AttrWrap(urwid.Text("Statistics", "center"), "statistics")
+        footer = urwid.AttrWrap(
+            urwid.Text("Press t or esc to return", "center"), "statistics"
+        )
+        body = urwid.AttrWrap(urwid.ListBox(urwid.SimpleFocusListWalker(rows)), "body")
+        super().__init__(urwid.Frame(body, header, footer))
+
+    @staticmethod
+    def table(title, periods):
+        most = max([episodes for _period, (episodes, _completed) in periods] + [1])
+        rows = [
+            urwid.Divider(" "),
+            urwid.Columns(
+                [
+                    ("weight", 0.2, urwid.Text(title)),
+                    ("weight", 0.15, urwid.Text("Episodes", align="right")),
+                    ("weight", 0.15, urwid.Text("Completed", align="right")),
+                    ("weight", 0.5, urwid.Text("")),
+                ],
+                dividechars=1,
+            ),
+            urwid.Divider("─"),
+        ]
+        for period, (episodes, completed) in periods:
+            graph = "█" * round(30 * max(episodes, 0) / most)
+            rows.append(
+                urwid.Columns(
+                    [
+                        ("weight", 0.2, urwid.Text(period)),
+                        ("weight", 0.15, urwid.Text(str(episodes), align="right")),
+                        ("weight", 0.15, urwid.Text(str(completed), align="right")),
+                        (
+                            "weight",
+                            0.5,
+                            urwid.AttrWrap(urwid.Text(graph), "statistics"),
+                        ),
+                    ],
+                    dividechars=1,
+                )
+            )
+        return rows
@@ -0,0 +1,713 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict, namedtuple
+from operator import attrgetter
+
+from sqlalchemy import bindparam, or_, select, text
+
+from miru.models import (
+    CRITERIA,
+    Series,
+    daily_table,
+    monthly_table,
+    revision_table,
+    series_table,
+    tombstones_table,
+)
+from miru.rules import ADD_VIEWS, REMOVE_VIEWS, chunks
+
+# The revision is left to the database's triggers.
+WRITTEN_COLUMNS = tuple(
+    column for column in Series.__slots__ if column not in ("id", "revision")
+)
+
+Changes = namedtuple("Changes", ["data_version", "revision", "rows", "deleted"])
+
+Statistics = namedtuple("Statistics", ["days", "months"])
+
+# A name that can be completed to, with the series already having it or None
+# for titles of the catalog.
+Completion = namedtuple("Completion", ["name", "episodes", "series"])
+
+
+def changed_ids(changes):
+    """Ids of the series in changes taken with `SeriesStore.take_changes`."""
+    updates, deletions = changes
+    return [params["series_id"] for _, params in updates] + list(deletions)
+
+
+def _assignments(saved, series):
+    # Assignments and parameters for an UPDATE turning the row of the series
+    # from how it was before the edits into how it is now. Changes to the
+    # seen count are applied as a difference with the rules of miru.rules
+    # and other columns are only set if they were changed, so that whatever
+    # else others have changed in the meantime is kept.
+    assignments = []
+    params = {"series_id": series.id}
+    difference = (series.seen or 0) - (saved["seen"] or 0)
+    if difference:
+        assignments.append(ADD_VIEWS if difference > 0 else REMOVE_VIEWS)
+        params["count"] = abs(difference)
+    for column in WRITTEN_COLUMNS:
+        value = getattr(series, column)
+        if column != "seen" and value != saved[column]:
+            assignments.append("{0} = :{0}".format(column))
+            params[column] = value
+    return ", ".join(assignments), params
+
+
+class Totals:
+    """Running aggregates of the series in a bucket."""
+
+    __slots__ = ("count", "seen", "episodes")
+
+    def __init__(self):
+        self.count = 0
+        self.seen = 0
+        self.episodes = 0
+
+    def add(self, seen, episodes, sign=1):
+        self.count += sign
+        self.seen += sign * seen
+        self.episodes += sign * episodes
+
+    @property
+    def completion(self):
+        return 100 * self.seen / self.episodes if self.episodes else 0
+
+
+class SortedKeys:
+    """Navigation over the sorted list of sort keys in `keys`."""
+
+    keys = ()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def index(self, key):
+        return bisect_left(self.keys, key)
+
+    def first(self):
+        return self.keys[0] if self.keys else None
+
+    def next(self, key):
+        index = bisect_right(self.keys, key)
+        return self.keys[index] if index < len(self.keys) else None
+
+    def prev(self, key):
+        index = bisect_left(self.keys, key)
+        return self.keys[index - 1] if index > 0 else None
+
+    def nearest(self, key):
+        if not self.keys:
+            return None
+        return self.keys[min(bisect_left(self.keys, key), len(self.keys) - 1)]
+
+    def between(self, low, high):
+        """The keys from `low` to `high`, both included."""
+        return self.keys[bisect_left(self.keys, low) : bisect_right(self.keys, high)]
+
+
+class Bucket(SortedKeys):
+    """Sorted collection of the series that satisfy a view's predicate.
+
+    Series are ordered by the `order_by` attribute with the id as a tie
+    breaker, and these sort keys double as positions in the interface's list
+    walkers. Listeners are called with the series and its old and new keys
+    whenever a series enters, leaves or moves within the bucket.
+
+    Changing the order only takes effect once `apply_order` is called, which
+    lets buckets of views that are not displayed be re-sorted lazily.
+
+    The bucket's totals are kept up to date with the seen and episode counts
+    each series contributed when it was last synced, so they never have to be
+    recomputed from scratch."""
+
+    def __init__(self, predicate, order_by="name"):
+        self.predicate = predicate
+        self.order_by = order_by
+        self.pending_order = None
+        self.keys = []
+        self.rows = {}
+        self.positions = {}
+        self.counted = {}
+        self.totals = Totals()
+        self.listeners = []
+
+    def sort_key(self, series):
+        return (getattr(series, self.order_by), series.id)
+
+    def get(self, key):
+        return self.rows.get(key)
+
+    def key_of(self, series_id):
+        return self.positions.get(series_id)
+
+    def fill(self, rows):
+        """Add the matching rows to the bucket. Series that are already in
+        it, having entered it while the rows were being queried, are kept
+        as they are."""
+        for series in rows:
+            if series.id not in self.positions and self.predicate(series):
+                key = self.sort_key(series)
+                self.keys.append(key)
+                self.rows[key] = series
+                self.positions[series.id] = key
+                self._count(series)
+        self.keys.sort()
+
+    def recount(self):
+        self.counted = {}
+        self.totals = Totals()
+        for series in self.rows.values():
+            self._count(series)
+
+    def set_order(self, order_by):
+        self.pending_order = order_by
+
+    def apply_order(self):
+        order_by, self.pending_order = self.pending_order, None
+        if order_by is None or order_by == self.order_by:
+            return
+        self.order_by = order_by
+        self.rows = {self.sort_key(series): series for series in self.rows.values()}
+        self.keys = sorted(self.rows)
+        self.positions = {series.id: key for key, series in self.rows.items()}
+
+    def sync(self, series, removed=False):
+        old_key = self._discard(series.id)
+        new_key = None
+        if not removed and self.predicate(series):
+            new_key = self.sort_key(series)
+            insort(self.keys, new_key)
+            self.rows[new_key] = series
+            self.positions[series.id] = new_key
+            self._count(series)
+        if old_key is not None or new_key is not None:
+            for listener in self.listeners:
+                listener(series, old_key, new_key)
+
+    def _discard(self, series_id):
+        key = self.positions.pop(series_id, None)
+        if key is not None:
+            del self.keys[bisect_left(self.keys, key)]
+            del self.rows[key]
+            self.totals.add(*self.counted.pop(series_id), sign=-1)
+        return key
+
+    def _count(self, series):
+        self.counted[series.id] = (series.seen, series.episodes)
+        self.totals.add(series.seen, series.episodes)
+
+
+class Matches(SortedKeys):
+    """A subset of a bucket's series, kept as their sort keys in the
+    bucket's order.
+
+    Sort keys end with the series' id, so matches can be picked out and
+    narrowed down further without looking the series up."""
+
+    def __init__(self, bucket, keys):
+        self.bucket = bucket
+        self.keys = keys
+
+    @classmethod
+    def of(cls, bucket, ids):
+        """Matches of the series in the bucket whose ids are in `ids`."""
+        positions = bucket.positions
+        if len(ids) * 8 < len(positions):
+            keys = sorted(
+                positions[series_id] for series_id in ids if series_id in positions
+            )
+        else:
+            keys = [key for key in bucket.keys if key[-1] in ids]
+        return cls(bucket, keys)
+
+    def __contains__(self, key):
+        index = bisect_left(self.keys, key)
+        return index < len(self.keys) and self.keys[index] == key
+
+    def get(self, key):
+        return self.bucket.get(key) if key in self else None
+
+    def rebuild(self):
+        """Pick up a new order of the bucket."""
+        positions = self.bucket.positions
+        self.keys = sorted(
+            positions[key[-1]] for key in self.keys if key[-1] in positions
+        )
+
+    def sync(self, old_key, new_key):
+        """Follow a series that moved within the bucket from `old_key` to
+        `new_key`, which is None if the series is no longer a match."""
+        if old_key is not None and old_key in self:
+            del self.keys[bisect_left(self.keys, old_key)]
+        if new_key is not None:
+            insort(self.keys, new_key)
+
+    def narrow(self, names, query):
+        """The matches whose names in `names`, a mapping from ids to names,
+        contain `query`."""
+        return Matches(
+            self.bucket, [key for key in self.keys if query in names[key[-1]]]
+        )
+
+
+class NameIndex(SortedKeys):
+    """Names of the series, along with the titles of a catalog, in
+    case-insensitive order for completing names as they are typed.
+
+    Keys are lowercased names followed by the id of the series, or by zero
+    for catalog titles, which thus come before series of the same name.
+    Series are followed with `sync` like buckets follow them, so the index
+    only has to be built once."""
+
+    def __init__(self, series, titles=()):
+        self.series = {item.id: item for item in series}
+        self.folded = {
+            series_id: item.name.lower() for series_id, item in self.series.items()
+        }
+        self.titles = {}
+        for name, episodes in titles:
+            self.titles.setdefault(name.lower(), (name, episodes))
+        self.keys = sorted(
+            [(folded, series_id) for series_id, folded in self.folded.items()]
+            + [(folded, 0) for folded in self.titles]
+        )
+
+    def sync(self, series, removed=False):
+        old = self.folded.get(series.id)
+        folded = None if removed else series.name.lower()
+        if old is not None and old != folded:
+            del self.keys[bisect_left(self.keys, (old, series.id))]
+            del self.folded[series.id]
+        if folded is None:
+            self.series.pop(series.id, None)
+            return
+        self.series[series.id] = series
+        if old != folded:
+            insort(self.keys, (folded, series.id))
+            self.folded[series.id] = folded
+
+    def complete(self, prefix, limit):
+        """Up to `limit` names starting with `prefix`. Catalog titles are
+        left out when there already is a series of the same name."""
+        prefix = prefix.lower()
+        keys = self.keys
+        completions = []
+        index = bisect_left(keys, (prefix,))
+        while index < len(keys) and len(completions) < limit:
+            folded, series_id = keys[index]
+            if not folded.startswith(prefix):
+                break
+            index += 1
+            if series_id:
+                series = self.series[series_id]
+                completions.append(Completion(series.name, series.episodes, series))
+            elif index == len(keys) or keys[index][0] != folded:
+                name, episodes = self.titles[folded]
+                completions.append(Completion(name, episodes, None))
+        return completions
+
+    def existing(self, name):
+        """Series whose name differs from `name` at most by case."""
+        folded = name.lower()
+        keys = self.keys
+        series = []
+        index = bisect_left(keys, (folded, 1))
+        while index < len(keys) and keys[index][0] == folded:
+            series.append(self.series[keys[index][1]])
+            index += 1
+        return series
+
+
+class SeriesStore:  # pylint: disable=R0904
+    """In-memory snapshot of the series table shared by all views.
+
+    The table is loaded as plain Series rows and partitioned into a bucket
+    per view predicate. Buckets can be loaded one at a time, so that the view
+    shown first does not have to wait for the others. Changes made through
+    the store keep the buckets up to date so that displaying a view never has
+    to go back to the database. Edited and deleted rows are remembered until
+    they are taken out with `take_changes` and written in a single
+    transaction.
+
+    Changes made by other connections are picked up with `changes_since`
+    and applied with `refresh`. Series with changes of our own that are not
+    written yet keep them until they are. Only the columns that were edited
+    are written, the seen count as a difference, so the changes of others
+    are kept, and the rows are read back once written.
+
+    The methods that only talk to the database, `query`, `fetch`, `insert`,
+    `write`, `current_revision` and `changes_since`, do not touch the store's
+    state and can be run on another thread. Everything else belongs to the
+    thread of the interface."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.buckets = {}
+        self.loaded = set()
+        self.records = {}
+        self.dirty = {}
+        # Values of the dirty series from before they were edited.
+        self.saved = {}
+        self.deleted = set()
+        self.removed = set()
+        # Number of writes underway for each series.
+        self.writing = Counter()
+        self.data_version = None
+        self.revision = 0
+        self.names = None
+
+    def bucket(self, criterion):
+        """Bucket of the series for which the predicate `criterion` holds."""
+        if criterion not in self.buckets:
+            self.buckets[criterion] = Bucket(attrgetter(criterion))
+        return self.buckets[criterion]
+
+    def unloaded(self, criteria=None):
+        return [
+            criterion
+            for criterion in (criteria or self.buckets)
+            if criterion not in self.loaded
+        ]
+
+    def load(self, criteria=None):
+        """Fill the buckets of `criteria`, by default all of them."""
+        criteria = self.unloaded(criteria)
+        if criteria:
+            self.fill(criteria, self.query(criteria))
+
+    def query(self, criteria):
+        """Rows of the series that belong to the buckets of `criteria`."""
+        query = select([series_table])
+        if len(criteria) < len(self.buckets):
+            query = query.where(or_(*(CRITERIA[criterion] for criterion in criteria)))
+        return self.engine.execute(query).fetchall()
+
+    def fill(self, criteria, rows):
+        """Fill the buckets of `criteria` with rows returned by `query`.
+
+        Buckets that got loaded in the meantime are left alone. Series that
+        are already in memory are reused as they are, so changes made to
+        them since are kept when more buckets are loaded later, and series
+        that entered the buckets since the query stay in them."""
+        criteria = self.unloaded(criteria)
+        if not criteria:
+            return
+        rows = [self._record(row) for row in rows if row[0] not in self.removed]
+        for criterion in criteria:
+            self.buckets[criterion].fill(rows)
+            self.loaded.add(criterion)
+
+    def _record(self, row):
+        series = self.records.get(row[0])
+        if series is None:
+            series = self.records[row[0]] = Series.from_row(row)
+        return series
+
+    def recount(self):
+        for bucket in self.buckets.values():
+            bucket.recount()
+
+    def insert(self, values):
+        """Insert a new series and return its id."""
+        result = self.engine.execute(
+            series_table.insert().values(
+                {key: value for key, value in values.items() if value is not None}
+            )
+        )
+        return result.inserted_primary_key[0]
+
+    def added(self, series_id, values):
+        """Show a series that was inserted with `insert`."""
+        series = Series(**values)
+        series.id = series_id
+        self.records[series.id] = series
+        self._sync(series)
+        return series
+
+    def add(self, **values):
+        return self.added(self.insert(values), values)
+
+    def edit(self, series, change):
+        """Apply `change`, a function of a series, to the series. The change
+        is written with the others taken with `take_changes`."""
+        if series.id not in self.saved:
+            self.saved[series.id] = series.values()
+        change(series)
+        self.dirty[series.id] = series
+        self._sync(series)
+
+    def delete(self, series):
+        self.dirty.pop(series.id, None)
+        self.saved.pop(series.id, None)
+        self.records.pop(series.id, None)
+        self.deleted.add(series.id)
+        self.removed.add(series.id)
+        self._sync(series, removed=True)
+
+    def index_names(self, titles=()):
+        """Build the NameIndex of the series and catalog `titles`, which
+        needs all of the buckets loaded."""
+        self.names = NameIndex(self.records.values(), titles)
+
+    def _sync(self, series, removed=False):
+        for bucket in self.buckets.values():
+            bucket.sync(series, removed)
+        if self.names is not None:
+            self.names.sync(series, removed)
+
+    @property
+    def pending(self):
+        return bool(self.dirty or self.deleted)
+
+    def take_changes(self):
+        """Pending changes as values for `write`, which are then forgotten.
+
+        The values are copies, so the series can go on changing while the
+        changes are being written. Series whose edits cancel each other out
+        are left out."""
+        updates = []
+        for series in self.dirty.values():
+            assignments, params = _assignments(self.saved[series.id], series)
+            if assignments:
+                updates.append((assignments, params))
+        changes = (updates, list(self.deleted))
+        self.writing.update(changed_ids(changes))
+        self.dirty = {}
+        self.saved = {}
+        self.deleted = set()
+        return changes
+
+    def written(self, ids, rows=()):
+        """Forget about a write of the series with the given ids, once the
+        changes taken with `take_changes` or made with `change_all` or
+        `remove_all` have been written or have failed to be. `rows` are the
+        rows the write returned, which have the changes others made to the
+        series before ours were written. They are only applied to series
+        that have no later writes underway, as those rows are older."""
+        for series_id in ids:
+            self.writing[series_id] -= 1
+            if self.writing[series_id] <= 0:
+                del self.writing[series_id]
+        self._apply(rows)
+
+    def write(self, changes):
+        """Write changes taken with `take_changes` and return the updated
+        rows as they are afterwards."""
+        updates, deletions = changes
+        statements = defaultdict(list)
+        for assignments, params in updates:
+            statements[assignments].append(params)
+        with self.engine.begin() as connection:
+            for assignments, params in statements.items():
+                connection.execute(
+                    text(
+                        "UPDATE series SET {} WHERE id = :series_id".format(assignments)
+                    ).bindparams(
+                        *(
+                            bindparam(column, type_=series_table.c[column].type)
+                            for column in params[0]
+                            if column in WRITTEN_COLUMNS
+                        )
+                    ),
+                    params,
+                )
+            if deletions:
+                connection.execute(
+                    series_table.delete().where(
+                        series_table.c.id == bindparam("series_id")
+                    ),
+                    [{"series_id": series_id} for series_id in deletions],
+                )
+        return self.fetch(params["series_id"] for _, params in updates)
+
+    def flush(self):
+        if self.pending:
+            changes = self.take_changes()
+            self.written(changed_ids(changes), self.write(changes))
+
+    def change_all(self, series, change):
+        """Apply `change`, a function of a series, to each of the series
+        and return their ids. The changes are not written with the others but
+        with `update_all`, after the changes already taken."""
+        for item in series:
+            change(item)
+            self._sync(item)
+        ids = [item.id for item in series]
+        self.writing.update(ids)
+        return ids
+
+    def update_all(self, ids, assignments, params):
+        """Apply SQL `assignments` from miru.rules to the series with the
+        given ids with set-based UPDATE statements in a single transaction
+        and return the updated rows as they are afterwards."""
+        self._execute_all(
+            "UPDATE series SET {} WHERE id IN :ids".format(assignments), ids, params
+        )
+        return self.fetch(ids)
+
+    def remove_all(self, series):
+        """Delete the series from memory and return their ids, which are to
+        be deleted from the database with `delete_all`."""
+        for item in series:
+            self.records.pop(item.id, None)
+            self.removed.add(item.id)
+            self._sync(item, removed=True)
+        ids = [item.id for item in series]
+        self.writing.update(ids)
+        return ids
+
+    def delete_all(self, ids):
+        self._execute_all("DELETE FROM series WHERE id IN :ids", ids, {})
+
+    def _execute_all(self, statement, ids, params):
+        statement = text(statement).bindparams(bindparam("ids", expanding=True))
+        with self.engine.begin() as connection:
+            for chunk in chunks(ids):
+                connection.execute(statement, dict(params, ids=chunk))
+
+    def current_revision(self):
+        return self.engine.execute(select([revision_table.c.value])).scalar()
+
+    def changes_since(self, data_version, revision):
+        """Changes committed by other connections since `revision`.
+
+        SQLite's data_version only changes when another connection commits,
+        so as long as it stays at `data_version` the tables are not read at
+        all. Has to run on the same thread each time, as every thread has a
+        connection and a data_version of its own."""
+        with self.engine.begin() as connection:
+            version = connection.execute("PRAGMA data_version").scalar()
+            if version == data_version:
+                return Changes(version, revision, [], [])
+            current = connection.execute(select([revision_table.c.value])).scalar()
+            if current == revision:
+                return Changes(version, revision, [], [])
+            rows = connection.execute(
+                select([series_table]).where(series_table.c.revision > revision)
+            ).fetchall()
+            deleted = [
+                row[0]
+                for row in connection.execute(
+                    select([tombstones_table.c.id]).where(
+                        tombstones_table.c.revision > revision
+                    )
+                )
+            ]
+        return Changes(version, current, rows, deleted)
+
+    def statistics(self, first_day, first_month):
+        """Episodes watched and series completed per day from `first_day` on
+        and per month from `first_month` on, as mappings from the days'
+        and months' ISO format strings to (episodes, completed) pairs. These
+        come from the rollups of the watch history, so the cost only depends
+        on the number of days and months asked for."""
+        with self.engine.begin() as connection:
+            days = connection.execute(
+                select([daily_table]).where(daily_table.c.day >= first_day)
+            ).fetchall()
+            months = connection.execute(
+                select([monthly_table]).where(monthly_table.c.month >= first_month)
+            ).fetchall()
+        return Statistics(
+            {row[0]: tuple(row[1:]) for row in days},
+            {row[0]: tuple(row[1:]) for row in months},
+        )
+
+    def refresh(self, changes):
+        """Apply changes returned by `changes_since`."""
+        self.data_version = changes.data_version
+        self.revision = max(self.revision, changes.revision)
+        self._apply(changes.rows)
+        for series_id in changes.deleted:
+            # Edits do not bring back a series deleted elsewhere.
+            series = self.records.get(series_id)
+            if series is None:
+                continue
+            self.dirty.pop(series_id, None)
+            self.saved.pop(series_id, None)
+            del self.records[series_id]
+            self.removed.add(series_id)
+            self._sync(series, removed=True)
+
+    def _apply(self, rows):
+        for row in rows:
+            series_id = row[0]
+            if self._unsaved(series_id):
+                continue
+            series = self.records.get(series_id)
+            if series is None:
+                self.removed.discard(series_id)
+                self._sync(self._record(row))
+            else:
+                # Every write takes a new revision, ours included, which does
+                # not change how the series is shown.
+                changed = False
+                for field, value in zip(Series.__slots__, row):
+                    if getattr(series, field) != value:
+                        setattr(series, field, value)
+                        changed = changed or field != "revision"
+                if changed:
+                    self._sync(series)
+
+    def _unsaved(self, series_id):
+        return (
+            series_id in self.dirty
+            or series_id in self.deleted
+            or series_id in self.writing
+        )
+
+    def fetch(self, ids):
+        """Rows of the series with the given ids that still exist."""
+        rows = []
+        for chunk in chunks(ids):
+            rows.extend(
+                self.engine.execute(
+                    select([series_table]).where(series_table.c.id.in_(chunk))
+                ).fetchall()
+            )
+        return rows
+
+    def restore(self, ids, rows):
+        """Put the series with the given ids back to how they are in the
+        database, after writing changes to them failed. `rows` are the rows
+        returned by `fetch` for the ids. Series with writes still underway
+        are left for those to bring up to date."""
+        rows = {row[0]: row for row in rows}
+        for series_id in ids:
+            if series_id in self.writing:
+                continue
+            self.dirty.pop(series_id, None)
+            self.saved.pop(series_id, None)
+            self.deleted.discard(series_id)
+            row = rows.get(series_id)
+            series = self.records.get(series_id)
+            if row is None:
+                if series is not None:
+                    del self.records[series_id]
+                    self._sync(series, removed=True)
+                continue
+            self.removed.discard(series_id)
+            if series is None:
+                series = self._record(row)
+            else:
+                for field, value in zip(Series.__slots__, row):
+                    setattr(series, field, value)
+            self._sync(series)
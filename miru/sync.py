@@ -0,0 +1,265 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Two-way synchronization of databases, e.g. ones kept on different
+# machines. Series are told apart by the random ids of the sync_series
+# table and only the series changed since the databases were last
+# synchronized with each other are exchanged. Like the scripting commands,
+# this works on plain sqlite3 connections.
+
+from collections import namedtuple
+
+FIELDS = ("name", "episodes", "seen", "status", "added", "completed")
+
+Row = namedtuple("Row", ("updated",) + FIELDS)
+
+SyncResult = namedtuple("SyncResult", ["sent", "received", "conflicts"])
+
+
+def merge(first, second):
+    """Resolve changes made to a series in both databases. The counts only
+    grow, so the larger seen and episode counts are kept and the earliest
+    time the series was added. The rest comes from the later change, or
+    from `first` if they were made within the same second."""
+    later = second if second.updated > first.updated else first
+    added = [row.added for row in (first, second) if row.added is not None]
+    return later._replace(
+        seen=max(first.seen or 0, second.seen or 0),
+        episodes=max(first.episodes or 0, second.episodes or 0),
+        added=min(added) if added else None,
+    )
+
+
+class Replica:
+    """One of the databases being synchronized."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.uid = connection.execute("SELECT uid FROM sync_identity").fetchone()[0]
+
+    def revision(self):
+        row = self.connection.execute("SELECT value FROM series_revision").fetchone()
+        return row[0]
+
+    def reidentify(self):
+        self.uid = self.connection.execute(
+            "SELECT lower(hex(randomblob(16)))"
+        ).fetchone()[0]
+        self.connection.execute("UPDATE sync_identity SET uid = ?", (self.uid,))
+
+    def watermark(self, peer):
+        """The revision of `peer` up to which its changes are known here."""
+        row = self.connection.execute(
+            "SELECT revision FROM sync_peers WHERE peer = ?", (peer.uid,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def set_watermark(self, peer, revision):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO sync_peers (peer, revision) VALUES (?, ?)",
+            (peer.uid, revision),
+        )
+
+    def changes(self, since):
+        """Series changed and deleted after revision `since`, as rows and
+        times of deletion by id. All series are returned when `since` is
+        zero, however long ago they last changed."""
+        rows = self.connection.execute(
+            "SELECT sync_series.uid, sync_series.updated, {} FROM series "
+            "JOIN sync_series ON sync_series.id = series.id{}".format(
+                ", ".join(FIELDS), " WHERE series.revision > ?" if since else ""
+            ),
+            (since,) if since else (),
+        )
+        changed = {row[0]: Row(*row[1:]) for row in rows}
+        deleted = dict(
+            self.connection.execute(
+                "SELECT uid, deleted FROM sync_tombstones WHERE revision > ?", (since,)
+            )
+        )
+        return changed, deleted
+
+    def find(self, uid):
+        row = self.connection.execute(
+            "SELECT id FROM sync_series WHERE uid = ?", (uid,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get(self, series_id):
+        row = self.connection.execute(
+            "SELECT sync_series.updated, {} FROM series "
+            "JOIN sync_series ON sync_series.id = series.id "
+            "WHERE series.id = ?".format(", ".join(FIELDS)),
+            (series_id,),
+        ).fetchone()
+        return Row(*row)
+
+    def store(self, uid, row):
+        """Make the series `uid` look like `row`. Return whether anything
+        had to be changed."""
+        series_id = self.find(uid)
+        if series_id is not None and self.get(series_id)[1:] == row[1:]:
+            return False
+        values = {field: getattr(row, field) for field in FIELDS}
+        if series_id is None:
+            series_id = self.connection.execute(
+                "INSERT INTO series ({}) VALUES ({})".format(
+                    ", ".join(FIELDS), ", ".join(":" + field for field in FIELDS)
+                ),
+                values,
+            ).lastrowid
+        else:
+            self.connection.execute(
+                "UPDATE series SET {} WHERE id = :id".format(
+                    ", ".join("{0} = :{0}".format(field) for field in FIELDS)
+                ),
+                dict(values, id=series_id),
+            )
+        # The triggers give new series an id of their own and the current
+        # time, which are replaced with the ones the change came with.
+        self.connection.execute(
+            "UPDATE sync_series SET uid = ?, updated = ? WHERE id = ?",
+            (uid, row.updated, series_id),
+        )
+        # A series brought back after being deleted here must not be sent
+        # on as deleted too.
+        self.connection.execute("DELETE FROM sync_tombstones WHERE uid = ?", (uid,))
+        return True
+
+    def remove(self, uid, deleted):
+        series_id = self.find(uid)
+        if series_id is None:
+            return False
+        self.connection.execute("DELETE FROM series WHERE id = ?", (series_id,))
+        self.connection.execute(
+            "UPDATE sync_tombstones SET deleted = ? WHERE uid = ?", (deleted, uid)
+        )
+        return True
+
+    def pause_history(self):
+        """Keep the changes made from here on out of the watch history."""
+        self.connection.execute("INSERT INTO watch_paused (reason) VALUES ('sync')")
+
+    def resume_history(self):
+        self.connection.execute("DELETE FROM watch_paused WHERE reason = 'sync'")
+
+    def rename(self, uid, new_uid):
+        self.connection.execute(
+            "UPDATE sync_series SET uid = ? WHERE uid = ?", (new_uid, uid)
+        )
+
+
+def _pair_by_name(second, first_changes, second_changes):
+    # Databases synchronized for the first time are often copies of one
+    # another, or have series added on both sides before. Series that go by
+    # a name used only once in each database are taken to be the same one,
+    # unless the id of the first is already used in the second, as when
+    # both were synchronized with a third database and one of them has
+    # since renamed the series.
+    def unique(rows):
+        names = {}
+        for uid, row in rows.items():
+            names[row.name] = None if row.name in names else uid
+        return names
+
+    theirs = unique(second_changes)
+    for name, uid in unique(first_changes).items():
+        other = theirs.get(name)
+        if (
+            uid is not None
+            and other is not None
+            and other != uid
+            and uid not in second_changes
+        ):
+            second.rename(other, uid)
+            second_changes[uid] = second_changes.pop(other)
+
+
+def _exchange(target, changed, deleted, other_changed, other_deleted):
+    # Applies changes that do not conflict with any made in `target` and
+    # returns how many changes that took.
+    count = 0
+    for uid, row in changed.items():
+        if uid in other_changed:
+            continue
+        if uid in other_deleted and other_deleted[uid] >= row.updated:
+            continue
+        count += target.store(uid, row)
+    for uid, time in deleted.items():
+        if uid in other_changed and other_changed[uid].updated > time:
+            continue
+        count += target.remove(uid, time)
+    return count
+
+
+def _apply(one, other):
+    since = [one.watermark(other), other.watermark(one)]
+    first_changed, first_deleted = one.changes(since[1])
+    second_changed, second_deleted = other.changes(since[0])
+    if since == [0, 0]:
+        _pair_by_name(other, first_changed, second_changed)
+    sent = _exchange(
+        other, first_changed, first_deleted, second_changed, second_deleted
+    )
+    received = _exchange(
+        one, second_changed, second_deleted, first_changed, first_deleted
+    )
+    conflicts = 0
+    for uid in first_changed.keys() & second_changed.keys():
+        if first_changed[uid][1:] != second_changed[uid][1:]:
+            conflicts += 1
+        row = merge(first_changed[uid], second_changed[uid])
+        received += one.store(uid, row)
+        sent += other.store(uid, row)
+    return SyncResult(sent, received, conflicts)
+
+
+def synchronize(first, second):
+    """Exchange the changes made to two databases, given as sqlite3
+    connections, since they were last synchronized.
+
+    A series changed in both is merged with `merge`. A series deleted in
+    one and changed in the other stays deleted unless the change was made
+    later. The databases are locked for writing for the duration, and all
+    changes are committed only once both have been applied. Counts of
+    seen episodes received from the other database are not logged in the
+    watch history."""
+    replicas = [Replica(first), Replica(second)]
+    one, other = replicas
+    try:
+        for replica in replicas:
+            replica.connection.isolation_level = None
+            replica.connection.execute("BEGIN IMMEDIATE")
+            replica.pause_history()
+        if one.uid == other.uid:
+            # One of the databases is a copy of the other.
+            other.reidentify()
+        result = _apply(one, other)
+        # Now that both have everything, the revisions the changes from the
+        # other database took do not have to be sent back to it. Were this
+        # not done, they would be next time but would not change anything.
+        end = [one.revision(), other.revision()]
+        one.set_watermark(other, end[1])
+        other.set_watermark(one, end[0])
+        for replica in reversed(replicas):
+            replica.resume_history()
+            replica.connection.execute("COMMIT")
+    except BaseException:
+        for replica in replicas:
+            if replica.connection.in_transaction:
+                replica.connection.execute("ROLLBACK")
+        raise
+    return result
@@ -0,0 +1,58 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import time
+
+
+class StartupTrace:
+    """Wall clock time spent in each step of starting up.
+
+    The time before the trace was created, which is mostly the interpreter
+    starting and the first imports, is only known as CPU time."""
+
+    def __init__(self):
+        self.before = time.process_time()
+        self.started = self.last = time.perf_counter()
+        self.steps = []
+        self.first_frame = None
+
+    def mark(self, step):
+        now = time.perf_counter()
+        self.steps.append((step, now - self.last))
+        self.last = now
+
+    def frame_drawn(self):
+        self.mark("first frame")
+        self.first_frame = self.last - self.started
+
+    def report(self, stream=sys.stderr):
+        print(
+            "{:8.1f} ms  interpreter and imports (CPU time)".format(self.before * 1000),
+            file=stream,
+        )
+        for step, elapsed in self.steps:
+            print("{:8.1f} ms  {}".format(elapsed * 1000, step), file=stream)
+        if self.first_frame is not None:
+            print(
+                "{:8.1f} ms  time to first frame".format(
+                    (self.before + self.first_frame) * 1000
+                ),
+                file=stream,
+            )
+
+
+startup = StartupTrace()
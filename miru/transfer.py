@@ -0,0 +1,402 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import csv
+import json
+import sqlite3
+import struct
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+
+from sqlalchemy import bindparam, select
+
+from miru.models import CRITERIA, series_table
+from miru.rules import DEFAULT_BATCH_SIZE, MAX_COUNT, STATUSES, chunks
+
+FIELDS = ("name", "episodes", "seen", "status", "added", "completed")
+
+EXPORT_FIELDS = ("id",) + FIELDS
+
+NAME_LENGTH = series_table.c.name.type.length
+
+DATETIME_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%d",
+)
+
+ImportResult = namedtuple(
+    "ImportResult", ["inserted", "updated", "replaced", "skipped"]
+)
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(stream):
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield number, InvalidRow(str(error))
+            continue
+        yield number, row
+
+
+# The binary format is a magic header followed by one record per series:
+# id, episodes and seen as unsigned 32 bit integers, the status as an index
+# to STATUSES plus one, a flag byte telling which of the dates are present,
+# the present dates as microseconds since the epoch and finally the name
+# prefixed by its length in bytes. All numbers are little-endian.
+BINARY_MAGIC = b"MIRU\x01"
+BINARY_RECORD = struct.Struct("<IIIBB")
+BINARY_DATE = struct.Struct("<q")
+BINARY_NAME_LENGTH = struct.Struct("<H")
+EPOCH = datetime(1970, 1, 1)
+
+
+def read_binary(stream):
+    if stream.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        yield 0, InvalidRow("Not a Miru binary export")
+        return
+    number = 0
+    while True:
+        header = stream.read(BINARY_RECORD.size)
+        if not header:
+            return
+        number += 1
+        try:
+            yield number, _binary_row(header, stream)
+        except InvalidRow as error:
+            # A truncated record leaves the stream at its end, so the loop
+            # stops on the next read.
+            yield number, error
+
+
+def _binary_row(header, stream):
+    if len(header) < BINARY_RECORD.size:
+        raise InvalidRow("Truncated record")
+    series_id, episodes, seen, status, flags = BINARY_RECORD.unpack(header)
+    row = {"id": series_id, "episodes": episodes, "seen": seen}
+    for bit, field in enumerate(("added", "completed")):
+        row[field] = None
+        if flags & (1 << bit):
+            (micros,) = BINARY_DATE.unpack(_read_exactly(stream, BINARY_DATE.size))
+            try:
+                row[field] = EPOCH + timedelta(microseconds=micros)
+            except OverflowError as error:
+                raise InvalidRow("{} is out of range".format(field)) from error
+    (length,) = BINARY_NAME_LENGTH.unpack(
+        _read_exactly(stream, BINARY_NAME_LENGTH.size)
+    )
+    name = _read_exactly(stream, length)
+    try:
+        row["name"] = name.decode("utf-8")
+    except UnicodeDecodeError as error:
+        raise InvalidRow("name is not valid UTF-8") from error
+    if status > len(STATUSES):
+        raise InvalidRow("Unknown status: {}".format(status))
+    row["status"] = STATUSES[status - 1] if status else None
+    return row
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise InvalidRow("Truncated record")
+    return data
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "binary": read_binary}
+
+BINARY_FORMATS = {"binary"}
+
+
+def _integer(row, field, default):
+    value = row.get(field)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError) as error:
+        raise InvalidRow("{} is not a number: {!r}".format(field, value)) from error
+    if number < 0:
+        raise InvalidRow("{} can not be negative".format(field))
+    if number > MAX_COUNT:
+        raise InvalidRow("{} can not be larger than {}".format(field, MAX_COUNT))
+    return number
+
+
+def _datetime(row, field):
+    value = row.get(field)
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    for date_format in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except (TypeError, ValueError):
+            pass
+    raise InvalidRow("{} is not a date: {!r}".format(field, value))
+
+
+def validate(row):
+    """Turn an input row into column values of the series table."""
+    if not isinstance(row, dict):
+        raise InvalidRow("Expected an object, got {!r}".format(row))
+    name = row.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise InvalidRow("name is missing")
+    if len(name) > NAME_LENGTH:
+        raise InvalidRow("name is longer than {} characters".format(NAME_LENGTH))
+    episodes = _integer(row, "episodes", 1)
+    seen = _integer(row, "seen", 0)
+    if seen > episodes:
+        raise InvalidRow("seen ({}) exceeds episodes ({})".format(seen, episodes))
+    status = row.get("status") or None
+    if status is not None and status not in STATUSES:
+        raise InvalidRow(
+            "status must be one of {}: {!r}".format(", ".join(STATUSES), status)
+        )
+    return {
+        "name": name,
+        "episodes": episodes,
+        "seen": seen,
+        "status": status,
+        "added": _datetime(row, "added"),
+        "completed": _datetime(row, "completed"),
+    }
+
+
+def read_catalog(path):
+    """Names and episode counts of the titles in a CSV or JSON Lines file
+    with name and episodes fields, for completing the names of new series.
+    Rows without a name are skipped and invalid episode counts left out."""
+    suffix = Path(path).suffix.lower()
+    reader = read_jsonl if suffix in (".jsonl", ".ndjson") else read_csv
+    titles = []
+    with open(path, newline="", encoding="utf-8") as stream:
+        for _number, row in reader(stream):
+            if not isinstance(row, dict):
+                continue
+            name = row.get("name")
+            if not isinstance(name, str) or not name.strip():
+                continue
+            try:
+                episodes = _integer(row, "episodes", None)
+            except InvalidRow:
+                episodes = None
+            titles.append((name, episodes))
+    return titles
+
+
+def _valid_rows(rows, on_invalid):
+    for number, row in rows:
+        try:
+            if isinstance(row, InvalidRow):
+                raise row
+            yield number, validate(row)
+        except InvalidRow as error:
+            on_invalid(number, error)
+
+
+def import_series(
+    engine, rows, batch_size=DEFAULT_BATCH_SIZE, upsert=False, on_invalid=None
+):
+    """Insert series from an iterable of (line number, row) pairs.
+
+    Rows are validated and written in batches of `batch_size`, each batch
+    with a single executemany in its own transaction, so memory use does not
+    depend on the size of the input. With `upsert`, rows whose name already
+    exists update the existing series instead, and rows followed by another
+    one of the same name in the same batch are replaced by it. Names shared
+    by several existing series make the row invalid. Invalid rows are passed
+    to `on_invalid` along with their line number and skipped, or raise
+    InvalidRow if no callback was given."""
+    inserted = updated = replaced = skipped = 0
+
+    def invalid(number, error):
+        nonlocal skipped
+        if on_invalid is None:
+            raise InvalidRow("Line {}: {}".format(number, error)) from error
+        skipped += 1
+        on_invalid(number, error)
+
+    valid = _valid_rows(rows, invalid)
+    while True:
+        batch = list(islice(valid, batch_size))
+        if not batch:
+            break
+        with engine.begin() as connection:
+            counts = _write_batch(connection, batch, upsert, invalid)
+        inserted += counts[0]
+        updated += counts[1]
+        replaced += counts[2]
+    return ImportResult(inserted, updated, replaced, skipped)
+
+
+def _write_batch(connection, batch, upsert, on_ambiguous):
+    # Returns the numbers of rows inserted, updated and replaced.
+    updated = replaced = 0
+    if upsert:
+        inserts, updates, replaced = _split_existing(connection, batch, on_ambiguous)
+        if updates:
+            connection.execute(
+                series_table.update()
+                .where(series_table.c.id == bindparam("series_id"))
+                .values({field: bindparam(field) for field in FIELDS}),
+                updates,
+            )
+            updated = len(updates)
+    else:
+        inserts = [row for _, row in batch]
+    if inserts:
+        connection.execute(series_table.insert(), inserts)
+    return len(inserts), updated, replaced
+
+
+def _split_existing(connection, batch, on_ambiguous):
+    # Later rows win over earlier ones with the same name, which are counted
+    # as replaced.
+    by_name = {}
+    for number, row in batch:
+        by_name[row["name"]] = (number, row)
+    existing = defaultdict(list)
+    for chunk in chunks(by_name):
+        query = select([series_table.c.name, series_table.c.id]).where(
+            series_table.c.name.in_(chunk)
+        )
+        for name, series_id in connection.execute(query):
+            existing[name].append(series_id)
+    inserts = []
+    updates = []
+    for name, (number, row) in by_name.items():
+        ids = existing.get(name, [])
+        if len(ids) > 1:
+            # Like the scripting commands, rather than guessing which one
+            # was meant.
+            on_ambiguous(
+                number, InvalidRow("{} series are named {}".format(len(ids), name))
+            )
+        elif ids:
+            updates.append(dict(row, series_id=ids[0]))
+        else:
+            inserts.append(row)
+    return inserts, updates, len(batch) - len(by_name)
+
+
+def export_rows(engine, criterion=None, order_by="name", batch_size=1000):
+    """Stream rows of the series table as dictionaries.
+
+    `criterion` names one of the view predicates in CRITERIA. Rows are fetched
+    from the cursor `batch_size` at a time, so the whole result is never held
+    in memory."""
+    query = select([series_table])
+    if criterion is not None:
+        query = query.where(CRITERIA[criterion])
+    query = query.order_by(series_table.c[order_by], series_table.c.id)
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(query)
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+
+
+def _format_date(value):
+    return value.isoformat(" ") if value is not None else None
+
+
+def write_csv(stream, rows):
+    writer = csv.DictWriter(stream, EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        row["added"] = _format_date(row["added"])
+        row["completed"] = _format_date(row["completed"])
+        writer.writerow(row)
+
+
+def write_jsonl(stream, rows):
+    for row in rows:
+        row["added"] = _format_date(row["added"])
+        row["completed"] = _format_date(row["completed"])
+        stream.write(json.dumps({field: row[field] for field in EXPORT_FIELDS}))
+        stream.write("\n")
+
+
+def write_binary(stream, rows):
+    stream.write(BINARY_MAGIC)
+    for row in rows:
+        dates = [row["added"], row["completed"]]
+        flags = sum(1 << bit for bit, date in enumerate(dates) if date is not None)
+        status = STATUSES.index(row["status"]) + 1 if row["status"] else 0
+        name = row["name"].encode("utf-8")
+        counts = [row["episodes"] or 0, row["seen"] or 0]
+        if max(counts) > MAX_COUNT:
+            # Imports do not let these in, but the interface does.
+            raise InvalidRow(
+                "{} has more than {} episodes, which the binary format can not "
+                "store".format(row["name"], MAX_COUNT)
+            )
+        stream.write(BINARY_RECORD.pack(row["id"], *counts, status, flags))
+        for date in dates:
+            if date is not None:
+                micros = (date - EPOCH) // timedelta(microseconds=1)
+                stream.write(BINARY_DATE.pack(micros))
+        stream.write(BINARY_NAME_LENGTH.pack(len(name)))
+        stream.write(name)
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "binary": write_binary}
+
+
+def backup(engine, destination, pages=256, sleep=0.05, progress=None):
+    """Copy the database to `destination` with SQLite's online backup API.
+
+    The copy is made `pages` pages at a time, so other connections are only
+    locked out for short moments. Whenever the database is busy, the copy
+    waits `sleep` seconds before trying again. The result is a consistent
+    snapshot of the database."""
+    source = engine.raw_connection()
+    target = sqlite3.connect(destination)
+    try:
+        source.connection.backup(
+            target,
+            pages=pages,
+            sleep=sleep,
+            progress=(lambda _status, remaining, total: progress(remaining, total))
+            if progress
+            else None,
+        )
+    finally:
+        target.close()
+        source.close()
@@ -0,0 +1,83 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class DatabaseWorker:
+    """Runs database work on a thread of its own.
+
+    Jobs run one at a time in the order they were submitted. Once the worker
+    has been started on a urwid main loop, a finished job's future is passed
+    to its callback on the loop's thread, woken up through a pipe. Until
+    then jobs run right away on the calling thread. A `wrapper`, if set, is
+    applied to every job as it is submitted."""
+
+    def __init__(self):
+        self.executor = None
+        self.loop = None
+        self.pipe = None
+        self.finished = deque()
+        self.wrapper = None
+
+    def start(self, loop):
+        self.loop = loop
+        self.pipe = loop.watch_pipe(self._deliver)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, function, *args, callback=None):
+        if self.wrapper is not None:
+            function = self.wrapper(function)
+        if self.executor is None:
+            future = Future()
+            try:
+                future.set_result(function(*args))
+            except Exception as error:  # pylint: disable=W0703
+                future.set_exception(error)
+            if callback is not None:
+                callback(future)
+            return future
+        future = self.executor.submit(function, *args)
+        if callback is not None:
+            future.add_done_callback(lambda done: self._finished(callback, done))
+        return future
+
+    def call(self, function, *args):
+        """Run a job after the ones submitted before it and wait for it."""
+        return self.submit(function, *args).result()
+
+    def _finished(self, callback, future):
+        # Called on the worker thread.
+        self.finished.append((callback, future))
+        os.write(self.pipe, b"\n")
+
+    def _deliver(self, _data):
+        while self.finished:
+            callback, future = self.finished.popleft()
+            callback(future)
+        return True
+
+    def stop(self):
+        """Wait for the submitted jobs to finish and run the callbacks that
+        are still due. Jobs submitted after this run on the calling thread."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+            self.loop.remove_watch_pipe(self.pipe)
+            os.close(self.pipe)
+            self._deliver(None)
@@ -18,6 +18,7 @@ setup(
     packages=find_packages(),
     entry_points={"console_scripts": ["miru=miru.app:main"]},
     install_requires=["urwid", "sqlalchemy"],
+    python_requires=">=3.7",
     classifiers=[
         "License :: OSI Approved :: GNU General Public License v3 (GPLv3)",
         "Environment :: Console :: Curses",
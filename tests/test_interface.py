@@ -0,0 +1,138 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from unittest import mock
+
+from miru.database import connect_database
+from miru.interface import MainWindow
+from miru.migrations import upgrade
+from miru.models import series_table
+
+SCREEN_SIZE = (80, 24)
+
+
+class KeyTest(unittest.TestCase):
+    """Presses keys in a MainWindow without a terminal, the way the
+    benchmarks do. The worker is never started, so changes are written right
+    away."""
+
+    def setUp(self):
+        patcher = mock.patch("miru.interface.set_terminal_title")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.engine = connect_database(None, memory=True)
+        upgrade(self.engine)
+        self.engine.execute(
+            series_table.insert(),
+            [
+                {"name": "Bebop", "episodes": 26, "seen": 20},
+                {"name": "Lain", "episodes": 13, "seen": 0},
+            ],
+        )
+        self.window = MainWindow(self.engine)
+
+    def tearDown(self):
+        self.window.writer.close()
+        self.engine.dispose()
+
+    def press(self, *keys):
+        for key in keys:
+            self.window.loop.process_input([key])
+        self.window.frame.render(SCREEN_SIZE, focus=True)
+
+    def seen(self):
+        return dict(self.engine.execute("SELECT name, seen FROM series").fetchall())
+
+    @property
+    def view(self):
+        return self.window.views[self.window.current]
+
+    def test_count_prefixes(self):
+        self.press("5", "i")
+        self.assertEqual(self.seen()["Bebop"], 25)
+        self.press("1", "2", "d")
+        self.assertEqual(self.seen()["Bebop"], 13)
+        self.assertEqual(self.view.count, 0)
+
+    def test_count_is_dropped_by_other_keys(self):
+        self.press("3", "j")
+        self.assertEqual(self.view.count, 0)
+        self.assertEqual(self.view.walker.focused_series().name, "Lain")
+        self.press("i")
+        self.assertEqual(self.seen(), {"Bebop": 20, "Lain": 1})
+
+    def test_zero_is_not_a_count(self):
+        self.press("0", "i")
+        self.assertEqual(self.seen()["Bebop"], 21)
+
+    def test_going_to_views(self):
+        self.press("g", "3")
+        self.assertEqual(self.window.current, 2)
+        self.press("g", "1")
+        self.assertEqual(self.window.current, 0)
+
+    def test_going_drops_the_count(self):
+        self.press("3", "g", "2")
+        self.assertEqual(self.window.current, 1)
+        self.assertEqual(self.window.views[0].count, 0)
+        self.press("g", "1", "i")
+        self.assertEqual(self.seen()["Bebop"], 21)
+
+    def test_invalid_view_suffix(self):
+        self.press("g", "9")
+        self.assertEqual(self.window.current, 0)
+        self.assertTrue(self.view.taking_commands)
+        # Anything but a number is taken as a key of its own.
+        self.press("g", "j")
+        self.assertEqual(self.window.current, 0)
+        self.assertEqual(self.view.walker.focused_series().name, "Lain")
+        self.press("i")
+        self.assertEqual(self.seen()["Lain"], 1)
+
+    def test_refresh_keeps_an_open_prompt(self):
+        self.press("i", "/", "l")
+        self.engine.execute("UPDATE series SET episodes = 30 WHERE name = 'Bebop'")
+        store = self.window.store
+        store.refresh(store.changes_since(None, store.revision))
+        self.press()
+        self.assertEqual(self.view.walker.totals.episodes, 43)
+        self.assertEqual(self.view._w.focus_position, "footer")
+        self.press("a")
+        self.assertFalse(self.window.displaying_dialog)
+        self.assertEqual(self.view.walker.query, "la")
+
+    def coalesce(self, *keys):
+        return self.window.coalesce_input(list(keys), [])
+
+    def test_repeated_keys_are_coalesced(self):
+        self.assertEqual(self.coalesce("i", "i", "i", "d"), ["2", "i"])
+        self.assertEqual(self.coalesce(*["d"] * 12), ["1", "2", "d"])
+        self.assertEqual(self.coalesce("i", "d"), [])
+        self.assertEqual(self.coalesce("i"), ["i"])
+        self.assertEqual(self.coalesce("i", "j", "i"), ["i", "j", "i"])
+        self.press(*self.coalesce("i", "i", "i"))
+        self.assertEqual(self.seen()["Bebop"], 23)
+
+    def test_keys_are_not_coalesced_after_a_prefix(self):
+        self.press("2")
+        self.assertEqual(self.coalesce("i", "i"), ["i", "i"])
+        self.press("g")
+        self.assertEqual(self.coalesce("i", "i"), ["i", "i"])
+
+
+if __name__ == "__main__":
+    unittest.main()
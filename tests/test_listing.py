@@ -0,0 +1,185 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from miru.database import connect_database
+from miru.interface import CommitScheduler
+from miru.listing import SeriesWalker
+from miru.migrations import upgrade
+from miru.rules import SET_STATUS
+from miru.store import Matches, SeriesStore
+from miru.worker import DatabaseWorker
+
+CRITERIA = ["is_current", "is_completed", "is_on_hold", "is_dropped", "is_planned"]
+
+
+class WalkerTest(unittest.TestCase):
+    """Drives the walker of the current view against an in-memory database.
+    The worker is never started, so changes are written right away."""
+
+    def setUp(self):
+        self.engine = connect_database(None, memory=True)
+        upgrade(self.engine)
+        self.store = SeriesStore(self.engine)
+        for criterion in CRITERIA:
+            self.store.bucket(criterion)
+        self.store.load()
+        self.writer = CommitScheduler(self.store, 0, DatabaseWorker())
+        self.walker = SeriesWalker(self.store, self.writer, "is_current")
+        self.series = {
+            name: self.store.add(name=name, episodes=13, seen=0)
+            for name in ("Bebop", "Lain", "Planetes", "Serial Lain")
+        }
+        self.walker.reload()
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def shown(self):
+        return [self.walker.bucket.get(key).name for key in self.walker.shown.keys]
+
+    def focused(self):
+        series = self.walker.focused_series()
+        return series.name if series is not None else None
+
+    def focus(self, name):
+        self.walker.set_focus(self.walker.bucket.key_of(self.series[name].id))
+
+    def selected(self):
+        return [series.name for series in self.walker.selected_series()]
+
+    def rename(self, name, new_name):
+        series = self.series[name]
+
+        def change(item):
+            item.name = new_name
+
+        self.store.edit(series, change)
+        self.writer.commit()
+
+    def test_typing_narrows_matches(self):
+        self.walker.search("L")
+        self.assertEqual(self.shown(), ["Lain", "Planetes", "Serial Lain"])
+        self.walker.search("La")
+        self.assertEqual(self.shown(), ["Lain", "Planetes", "Serial Lain"])
+        self.walker.search("Lai")
+        self.assertEqual(self.shown(), ["Lain", "Serial Lain"])
+        self.assertEqual(
+            [query for query, _ in self.walker.searches], ["l", "la", "lai"]
+        )
+        self.assertEqual(self.focused(), "Lain")
+
+    def test_deleting_characters_goes_back_to_earlier_matches(self):
+        self.walker.search("l")
+        earlier = self.walker.matches
+        self.walker.search("lai")
+        self.walker.search("l")
+        self.assertIs(self.walker.matches, earlier)
+        self.assertEqual(self.shown(), ["Lain", "Planetes", "Serial Lain"])
+        self.walker.search("be")
+        self.assertEqual(self.shown(), ["Bebop"])
+        self.assertEqual([query for query, _ in self.walker.searches], ["be"])
+        self.walker.search("")
+        self.assertIsNone(self.walker.matches)
+        self.assertEqual(self.shown(), ["Bebop", "Lain", "Planetes", "Serial Lain"])
+
+    def test_narrow(self):
+        bucket = self.walker.bucket
+        names = {series.id: series.name.lower() for series in self.series.values()}
+        matches = Matches.of(bucket, {self.series["Lain"].id, self.series["Bebop"].id})
+        narrowed = matches.narrow(names, "ai")
+        self.assertEqual(narrowed.keys, [bucket.key_of(self.series["Lain"].id)])
+        self.assertEqual(len(matches), 2)
+
+    def test_renamed_series_follow_the_search(self):
+        self.walker.search("l")
+        self.walker.search("lai")
+        self.rename("Serial Lain", "Serial")
+        self.rename("Bebop", "Bebop Lain")
+        self.assertEqual(self.shown(), ["Bebop Lain", "Lain"])
+        # Earlier matches are kept up to date as well.
+        self.walker.search("l")
+        self.assertEqual(self.shown(), ["Bebop Lain", "Lain", "Planetes", "Serial"])
+
+    def test_deleting_the_focused_match(self):
+        self.walker.search("lai")
+        self.assertEqual(self.focused(), "Lain")
+        self.store.delete(self.series["Lain"])
+        self.assertEqual(self.shown(), ["Serial Lain"])
+        self.assertEqual(self.focused(), "Serial Lain")
+        self.store.delete(self.series["Serial Lain"])
+        self.assertIsNone(self.focused())
+        self.walker.search("")
+        self.assertEqual(self.shown(), ["Bebop", "Planetes"])
+
+    def test_range_is_kept_across_a_reorder(self):
+        for name, seen in (("Bebop", 3), ("Lain", 1), ("Planetes", 2)):
+            self.store.edit(
+                self.series[name], lambda item, seen=seen: item.set_seen(seen)
+            )
+        self.writer.commit()
+        self.focus("Bebop")
+        self.walker.toggle_range()
+        self.focus("Planetes")
+        self.assertEqual(self.selected(), ["Bebop", "Lain", "Planetes"])
+        self.walker.set_ordering("seen")
+        self.walker.reload()
+        self.assertEqual(self.shown(), ["Serial Lain", "Lain", "Planetes", "Bebop"])
+        self.assertEqual(self.focused(), "Planetes")
+        self.assertEqual(self.selected(), ["Planetes", "Bebop"])
+        self.walker.toggle_range()
+        self.assertIsNone(self.walker.anchor)
+        self.focus("Lain")
+        self.assertEqual(self.selected(), ["Planetes", "Bebop"])
+
+    def test_marked_series_leave_the_selection(self):
+        self.focus("Lain")
+        self.walker.toggle_selected()
+        self.walker.toggle_range()
+        self.focus("Planetes")
+        self.assertEqual(self.selected(), ["Lain", "Planetes"])
+
+        def mark(item):
+            item.status = "hold"
+
+        self.writer.update_all(
+            self.walker.selected_series(), mark, SET_STATUS, status="hold"
+        )
+        self.assertEqual(self.shown(), ["Bebop", "Serial Lain"])
+        self.assertFalse(self.walker.selecting)
+        self.assertEqual(self.selected(), [])
+        self.assertEqual(self.focused(), "Serial Lain")
+        rows = self.engine.execute("SELECT name FROM series WHERE status = 'hold'")
+        self.assertEqual(sorted(name for name, in rows), ["Lain", "Planetes"])
+        self.assertEqual(len(self.store.bucket("is_on_hold")), 2)
+
+    def test_clear_selection(self):
+        entry, _ = self.walker.get_focus()
+        self.walker.toggle_selected()
+        self.assertEqual(entry.attr_map[None], "selected")
+        self.focus("Lain")
+        self.walker.toggle_range()
+        self.focus("Planetes")
+        self.assertEqual(self.selected(), ["Bebop", "Lain", "Planetes"])
+        self.walker.clear_selection()
+        self.assertFalse(self.walker.selecting)
+        self.assertEqual(self.selected(), [])
+        self.assertIsNone(entry.attr_map[None])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sqlite3
+import unittest
+
+from miru.migrations import SCHEMA_VERSION, create_series_table, migrate, schema_version
+
+
+class UpgradeTest(unittest.TestCase):
+    """Upgrades a database left by an older version of Miru."""
+
+    def setUp(self):
+        self.connection = sqlite3.connect(":memory:", isolation_level=None)
+        create_series_table(self.connection)
+        self.connection.executemany(
+            "INSERT INTO series (name, episodes, seen) VALUES (?, ?, ?)",
+            [("Lain", "13", "3"), ("Bebop", "", ""), ("Eva", " 26 ", "many")],
+        )
+        migrate(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_counts_are_normalized(self):
+        self.assertEqual(schema_version(self.connection), SCHEMA_VERSION)
+        self.assertEqual(
+            sorted(self.connection.execute("SELECT name, episodes, seen FROM series")),
+            [("Bebop", 1, 0), ("Eva", 26, 0), ("Lain", 13, 3)],
+        )
+
+    def test_watch_history_is_empty(self):
+        for table in ("watch_events", "watch_daily", "watch_monthly"):
+            rows = self.connection.execute("SELECT * FROM {}".format(table))
+            self.assertEqual(rows.fetchall(), [])
+        # The trigger is back in place afterwards.
+        self.connection.execute("UPDATE series SET seen = 5 WHERE name = 'Lain'")
+        events = self.connection.execute("SELECT episodes FROM watch_events")
+        self.assertEqual(events.fetchall(), [(2,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
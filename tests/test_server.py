@@ -0,0 +1,192 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import http.client
+import json
+import threading
+import unittest
+
+from miru.database import connect_sqlite
+from miru.migrations import migrate
+from miru.server import MAX_BODY, Database, Server
+
+
+class ServerTest(unittest.TestCase):
+    """Runs the server on an in-memory database, with its event loop on a
+    thread of its own, and talks to it with http.client."""
+
+    def setUp(self):
+        self.connection = connect_sqlite(None, memory=True, threaded=True)
+        migrate(self.connection)
+        self.database = Database(self.connection, readers=2)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        self.listener = self.run_in_loop(
+            asyncio.start_server(Server(self.database).handle, "127.0.0.1", 0)
+        )
+        self.port = self.listener.sockets[0].getsockname()[1]
+        self.client = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+        # The listener belongs to the loop's thread like everything else of
+        # the server.
+        self.loop.call_soon_threadsafe(self.listener.close)
+        self.run_in_loop(self.listener.wait_closed())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.database.close()
+        self.connection.close()
+
+    def run_in_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(5)
+
+    def request(self, method, path, body=None, headers=None):
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.client.request(method, path, body, headers or {})
+        response = self.client.getresponse()
+        content = response.read()
+        return response.status, json.loads(content.decode("utf-8")) if content else None
+
+    def add(self, name, episodes, **values):
+        status, series = self.request(
+            "POST", "/series", dict(values, name=name, episodes=episodes)
+        )
+        self.assertEqual(status, 201)
+        return series
+
+    def test_add_and_get(self):
+        series = self.add("Cowboy Bebop", 26)
+        self.assertEqual(series["name"], "Cowboy Bebop")
+        self.assertEqual(series["seen"], 0)
+        self.assertIsNotNone(series["added"])
+        status, fetched = self.request("GET", "/series/{}".format(series["id"]))
+        self.assertEqual(status, 200)
+        self.assertEqual(fetched, series)
+
+    def test_counting_follows_the_rules(self):
+        series_id = self.add("Lain", 13, seen=2, status="hold")["id"]
+        path = "/series/{}/".format(series_id)
+        status, series = self.request("POST", path + "increment", {"count": 30})
+        self.assertEqual(status, 200)
+        self.assertEqual((series["seen"], series["status"]), (13, None))
+        _, series = self.request("POST", path + "decrement", {})
+        self.assertEqual(series["seen"], 12)
+        _, series = self.request("POST", path + "seen", {"seen": 99})
+        self.assertEqual(series["seen"], 13)
+        _, series = self.request("POST", path + "mark", {"status": "dropped"})
+        self.assertEqual(series["status"], "dropped")
+        _, series = self.request("POST", path + "mark", {"status": "active"})
+        self.assertIsNone(series["status"])
+
+    def test_delete(self):
+        path = "/series/{}".format(self.add("Lain", 13)["id"])
+        self.assertEqual(self.request("DELETE", path), (204, None))
+        self.assertEqual(self.request("GET", path)[0], 404)
+        self.assertEqual(self.request("DELETE", path)[0], 404)
+
+    def test_routing(self):
+        self.assertEqual(self.request("GET", "/nothing")[0], 404)
+        self.assertEqual(self.request("GET", "/series/1")[0], 404)
+        self.assertEqual(self.request("PUT", "/series/1")[0], 405)
+        self.assertEqual(self.request("GET", "/series/1/increment")[0], 405)
+
+    def test_validation(self):
+        series_id = self.add("Lain", 13)["id"]
+        path = "/series/{}/".format(series_id)
+        for method, target, body in [
+            ("POST", "/series", {"name": "", "episodes": 13}),
+            ("POST", "/series", {"name": "Lain", "episodes": "many"}),
+            ("POST", "/series", [1, 2]),
+            ("POST", "/series", b"{not json"),
+            ("POST", path + "increment", {"count": -1}),
+            ("POST", path + "seen", {}),
+            ("POST", path + "mark", {"status": "bogus"}),
+            ("GET", "/series?view=bogus", None),
+            ("GET", "/series?order=bogus", None),
+        ]:
+            status, result = self.request(method, target, body)
+            self.assertEqual(status, 400, (method, target, body))
+            self.assertIn("error", result)
+        _, series = self.request("GET", "/series/{}".format(series_id))
+        self.assertEqual(series["seen"], 0)
+
+    def test_integers_out_of_range(self):
+        series_id = self.add("Lain", 13)["id"]
+        path = "/series/{}/".format(series_id)
+        for method, target, body in [
+            ("POST", "/series", {"name": "Bebop", "episodes": 10**30}),
+            ("POST", path + "increment", {"count": 10**30}),
+            ("POST", path + "seen", {"seen": 2**63}),
+            ("GET", "/series/99999999999999999999999", None),
+            ("DELETE", "/series/{}".format(2**63), None),
+        ]:
+            status, result = self.request(method, target, body)
+            self.assertEqual(status, 400, (method, target, body))
+            self.assertIn("error", result)
+        # The connection is still there for the next request.
+        status, series = self.request("GET", "/series/{}".format(series_id))
+        self.assertEqual((status, series["seen"]), (200, 0))
+
+    def test_keep_alive(self):
+        self.add("Lain", 13)
+        sock = self.client.sock
+        self.assertIsNotNone(sock)
+        self.request("GET", "/series")
+        self.assertIs(self.client.sock, sock)
+        self.client.request("GET", "/series", headers={"Connection": "close"})
+        response = self.client.getresponse()
+        response.read()
+        self.assertEqual(response.getheader("Connection"), "close")
+        self.assertIsNone(self.client.sock)
+
+    def test_oversized_body(self):
+        status, _ = self.request("POST", "/series", b" " * (MAX_BODY + 1))
+        self.assertEqual(status, 413)
+
+    def test_listing(self):
+        self.add("Serial Experiments Lain", 13)
+        self.add("Cowboy Bebop", 26, seen=26)
+        _, listing = self.request("GET", "/series")
+        self.assertEqual(
+            [series["name"] for series in listing],
+            ["Cowboy Bebop", "Serial Experiments Lain"],
+        )
+        _, listing = self.request("GET", "/series?view=completed")
+        self.assertEqual([series["name"] for series in listing], ["Cowboy Bebop"])
+        _, listing = self.request("GET", "/series?view=current&order=episodes")
+        self.assertEqual(
+            [series["name"] for series in listing], ["Serial Experiments Lain"]
+        )
+
+    def test_listing_cache_follows_changes(self):
+        series_id = self.add("Lain", 13)["id"]
+        self.assertEqual(len(self.request("GET", "/series?view=current")[1]), 1)
+        self.request("POST", "/series/{}/seen".format(series_id), {"seen": 13})
+        self.assertEqual(self.request("GET", "/series?view=current")[1], [])
+        # Changes made by others than the server show up too.
+        with self.connection:
+            self.connection.execute("UPDATE series SET seen = 1")
+        _, listing = self.request("GET", "/series?view=current")
+        self.assertEqual([series["seen"] for series in listing], [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from miru.database import connect_database
+from miru.interface import CommitScheduler
+from miru.migrations import upgrade
+from miru.rules import SET_SEEN, SET_STATUS
+from miru.store import SeriesStore
+from miru.worker import DatabaseWorker
+
+CRITERIA = ["is_current", "is_completed", "is_on_hold", "is_dropped", "is_planned"]
+
+
+class Loop:
+    """The part of urwid's main loop the database worker needs. Finished
+    jobs are handed over only when `deliver` is called, so that tests can
+    let several jobs finish before the interface hears of any of them."""
+
+    def __init__(self):
+        self.pipes = {}
+
+    def watch_pipe(self, callback):
+        read, write = os.pipe()
+        self.pipes[write] = (read, callback)
+        return write
+
+    def remove_watch_pipe(self, write):
+        read, _ = self.pipes.pop(write)
+        os.close(read)
+
+    def deliver(self):
+        for read, callback in list(self.pipes.values()):
+            callback(os.read(read, 4096))
+
+
+class StoreTest(unittest.TestCase):
+    """Runs the store's writes on a started database worker against a
+    database file, the way the interface does."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = connect_database(str(Path(self.directory.name) / "miru.db"))
+        upgrade(self.engine)
+        self.store = SeriesStore(self.engine)
+        for criterion in CRITERIA:
+            self.store.bucket(criterion)
+        self.store.load()
+        self.loop = Loop()
+        self.worker = DatabaseWorker()
+        self.worker.start(self.loop)
+        self.writer = CommitScheduler(self.store, 0, self.worker)
+
+    def tearDown(self):
+        self.worker.stop()
+        self.directory.cleanup()
+
+    def add(self, name, episodes, seen=0, **values):
+        return self.store.add(name=name, episodes=episodes, seen=seen, **values)
+
+    def settle(self):
+        # Waits for the jobs submitted so far and then hands all of them over
+        # at once.
+        self.worker.call(lambda: None)
+        self.loop.deliver()
+
+    def row(self, series):
+        rows = self.store.fetch([series.id])
+        return rows[0] if rows else None
+
+    def test_edits_follow_each_other(self):
+        series = self.add("Lain", 13)
+        self.store.edit(series, lambda item: item.add_view())
+        self.writer.commit()
+        self.store.edit(series, lambda item: item.add_view(2))
+        self.writer.commit()
+        self.settle()
+        self.assertEqual(series.seen, 3)
+        self.assertEqual(self.row(series).seen, 3)
+
+    def test_written_rows_only_move_changed_series(self):
+        series = self.add("Lain", 13)
+        moves = []
+        self.store.bucket("is_current").listeners.append(
+            lambda item, old_key, new_key: moves.append(item.id)
+        )
+        self.store.edit(series, lambda item: item.add_view())
+        self.writer.commit()
+        self.settle()
+        # The new revision the write took is not a change to show.
+        self.assertEqual(moves, [series.id])
+        self.assertEqual(series.revision, self.row(series).revision)
+
+    def test_edit_then_delete(self):
+        series = self.add("Lain", 13)
+        self.store.edit(series, lambda item: item.add_view())
+        self.writer.commit()
+        self.store.delete(series)
+        self.writer.commit()
+        self.settle()
+        self.assertIsNone(self.row(series))
+        self.assertNotIn(series.id, self.store.records)
+        self.assertIsNone(self.store.bucket("is_current").key_of(series.id))
+
+    def test_written_rows_keep_changes_of_others(self):
+        series = self.add("Lain", 13, seen=2)
+        self.store.edit(series, lambda item: item.add_view())
+        with self.engine.begin() as connection:
+            connection.execute("UPDATE series SET episodes = 24, seen = 4")
+        self.writer.commit()
+        self.settle()
+        self.assertEqual((series.seen, series.episodes), (5, 24))
+
+    def test_edit_then_change_all(self):
+        series = self.add("Lain", 13)
+        self.store.edit(series, lambda item: item.add_view())
+        self.writer.commit()
+
+        def mark(item):
+            item.status = "hold"
+
+        self.writer.update_all([series], mark, SET_STATUS, status="hold")
+        self.settle()
+        self.assertEqual((series.seen, series.status), (1, "hold"))
+        self.assertEqual(self.row(series).status, "hold")
+        self.assertIsNone(self.store.bucket("is_current").key_of(series.id))
+        self.assertIsNotNone(self.store.bucket("is_on_hold").key_of(series.id))
+
+    def test_edit_then_delete_all(self):
+        series = self.add("Lain", 13)
+        self.store.edit(series, lambda item: item.add_view())
+        self.writer.commit()
+        self.writer.delete_all([series])
+        self.settle()
+        self.assertIsNone(self.row(series))
+        self.assertNotIn(series.id, self.store.records)
+        self.assertEqual(len(self.store.bucket("is_current")), 0)
+
+    def test_change_all_reads_back_rows(self):
+        series = self.add("Lain", 13)
+        with self.engine.begin() as connection:
+            connection.execute("UPDATE series SET episodes = 24")
+        self.writer.update_all(
+            [series], lambda item: item.set_seen(20), SET_SEEN, count=20
+        )
+        self.settle()
+        self.assertEqual((series.seen, series.episodes), (20, 24))
+        self.assertEqual(self.store.bucket("is_current").totals.seen, 20)
+
+    def test_fill_keeps_series_that_entered_the_bucket(self):
+        series = self.add("Lain", 13, seen=12)
+        self.add("Bebop", 26, seen=26)
+        store = SeriesStore(self.engine)
+        for criterion in CRITERIA:
+            store.bucket(criterion)
+        store.load(["is_current"])
+        rows = store.query(["is_completed"])
+        store.edit(store.records[series.id], lambda item: item.add_view())
+        store.fill(["is_completed"], rows)
+        completed = store.bucket("is_completed")
+        self.assertEqual(len(completed), 2)
+        self.assertEqual((completed.totals.count, completed.totals.seen), (2, 39))
+
+    def test_failure_is_kept_for_exit(self):
+        series = self.add("Lain", 13)
+        with self.engine.begin() as connection:
+            connection.execute(
+                "CREATE TRIGGER refuse BEFORE UPDATE ON series "
+                "BEGIN SELECT RAISE(ABORT, 'refused'); END"
+            )
+        self.store.edit(series, lambda item: item.add_view())
+        self.writer.commit()
+        self.settle()
+        self.settle()
+        self.assertEqual(series.seen, 0)
+        with self.engine.begin() as connection:
+            connection.execute("DROP TRIGGER refuse")
+        self.store.edit(series, lambda item: item.add_view(2))
+        self.writer.commit()
+        self.settle()
+        self.assertEqual(self.row(series).seen, 2)
+        self.assertIn("refused", self.writer.close())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,243 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from miru.migrations import migrate
+from miru.sync import Replica, Row, merge, synchronize
+
+
+def row(updated, **values):
+    fields = dict(
+        name="Lain", episodes=13, seen=0, status=None, added=None, completed=None
+    )
+    fields.update(values)
+    return Row(updated=updated, **fields)
+
+
+class MergeTest(unittest.TestCase):
+    def test_counts_only_grow(self):
+        merged = merge(
+            row("2020-01-02", seen=5, episodes=13, status="hold"),
+            row("2020-01-01", seen=7, episodes=26, status=None),
+        )
+        self.assertEqual((merged.seen, merged.episodes), (7, 26))
+        self.assertEqual(merged.status, "hold")
+
+    def test_later_change_wins(self):
+        merged = merge(
+            row("2020-01-01", name="Lain"), row("2020-01-02", name="Serial Lain")
+        )
+        self.assertEqual((merged.name, merged.updated), ("Serial Lain", "2020-01-02"))
+        merged = merge(row("2020-01-01", name="Lain"), row("2020-01-01", name="Other"))
+        self.assertEqual(merged.name, "Lain")
+
+    def test_earliest_added(self):
+        merged = merge(
+            row("2020-01-02", added="2019-05-01"), row("2020-01-01", added=None)
+        )
+        self.assertEqual(merged.added, "2019-05-01")
+        merged = merge(
+            row("2020-01-02", added="2019-05-01"),
+            row("2020-01-01", added="2018-01-01"),
+        )
+        self.assertEqual(merged.added, "2018-01-01")
+
+
+class SyncTest(unittest.TestCase):
+    """Synchronizes two in-memory databases."""
+
+    def setUp(self):
+        self.first = self.database()
+        self.second = self.database()
+
+    def tearDown(self):
+        self.first.close()
+        self.second.close()
+
+    @staticmethod
+    def database():
+        connection = sqlite3.connect(":memory:", isolation_level=None)
+        migrate(connection)
+        return connection
+
+    @staticmethod
+    def add(connection, name, episodes=13, seen=0):
+        connection.execute(
+            "INSERT INTO series (name, episodes, seen) VALUES (?, ?, ?)",
+            (name, episodes, seen),
+        )
+
+    @staticmethod
+    def series(connection):
+        return sorted(connection.execute("SELECT name, episodes, seen FROM series"))
+
+    def sync(self):
+        return synchronize(self.first, self.second)
+
+    def test_exchanges_series(self):
+        self.add(self.first, "Lain")
+        self.add(self.second, "Bebop", 26)
+        result = self.sync()
+        self.assertEqual((result.sent, result.received, result.conflicts), (1, 1, 0))
+        expected = [("Bebop", 26, 0), ("Lain", 13, 0)]
+        self.assertEqual(self.series(self.first), expected)
+        self.assertEqual(self.series(self.second), expected)
+
+    def test_pairs_series_by_name(self):
+        for connection in (self.first, self.second):
+            self.add(connection, "Lain")
+            self.add(connection, "Twice")
+            self.add(connection, "Twice")
+        self.first.execute("UPDATE series SET seen = 3 WHERE name = 'Lain'")
+        result = self.sync()
+        self.assertEqual(result.conflicts, 1)
+        for connection in (self.first, self.second):
+            names = [name for name, _, _ in self.series(connection)]
+            # Names used more than once are not paired.
+            self.assertEqual(names, ["Lain"] + ["Twice"] * 4)
+            self.assertEqual(self.series(connection)[0], ("Lain", 13, 3))
+
+    def test_renamed_series_is_not_paired(self):
+        third = self.database()
+        self.add(third, "Lain")
+        synchronize(self.first, third)
+        synchronize(self.second, third)
+        third.close()
+        self.first.execute("UPDATE series SET name = 'Serial Lain'")
+        self.add(self.second, "Serial Lain")
+        self.sync()
+        expected = [("Serial Lain", 13, 0)] * 2
+        self.assertEqual(self.series(self.first), expected)
+        self.assertEqual(self.series(self.second), expected)
+
+    def test_watermarks_advance(self):
+        self.add(self.first, "Lain")
+        self.sync()
+        first, second = Replica(self.first), Replica(self.second)
+        self.assertEqual(first.watermark(second), second.revision())
+        self.assertEqual(second.watermark(first), first.revision())
+        self.assertFalse(self.first.in_transaction)
+        self.assertEqual(self.sync(), (0, 0, 0))
+        self.second.execute("UPDATE series SET seen = 2")
+        self.assertEqual(self.sync(), (0, 1, 0))
+        self.assertEqual(self.series(self.first), [("Lain", 13, 2)])
+
+    @staticmethod
+    def watched(connection):
+        return connection.execute("SELECT sum(episodes) FROM watch_events").fetchone()[
+            0
+        ]
+
+    def test_received_counts_are_not_history(self):
+        self.add(self.first, "Lain")
+        self.sync()
+        self.second.execute("UPDATE series SET seen = 3")
+        self.sync()
+        self.assertEqual(self.series(self.first), [("Lain", 13, 3)])
+        self.assertIsNone(self.watched(self.first))
+        self.assertEqual(self.watched(self.second), 3)
+        self.first.execute("UPDATE series SET seen = 4")
+        self.assertEqual(self.watched(self.first), 1)
+
+    def test_changes_in_both_are_merged(self):
+        self.add(self.first, "Lain")
+        self.sync()
+        self.first.execute("UPDATE series SET seen = 4")
+        self.second.execute("UPDATE series SET episodes = 26, seen = 2")
+        result = self.sync()
+        self.assertEqual(result.conflicts, 1)
+        self.assertEqual(self.series(self.first), [("Lain", 26, 4)])
+        self.assertEqual(self.series(self.second), [("Lain", 26, 4)])
+
+    def delete_and_change(self, changed):
+        self.add(self.first, "Lain")
+        self.sync()
+        self.first.execute("DELETE FROM series")
+        self.first.execute("UPDATE sync_tombstones SET deleted = '2020-01-01 00:00:00'")
+        self.second.execute("UPDATE series SET seen = 5")
+        self.second.execute("UPDATE sync_series SET updated = ?", (changed,))
+        self.sync()
+
+    def test_later_change_brings_back_deleted_series(self):
+        self.delete_and_change("2020-01-02 00:00:00")
+        self.assertEqual(self.series(self.first), [("Lain", 13, 5)])
+        self.assertEqual(self.series(self.second), [("Lain", 13, 5)])
+
+    def test_earlier_change_stays_deleted(self):
+        self.delete_and_change("2019-12-31 00:00:00")
+        self.assertEqual(self.series(self.first), [])
+        self.assertEqual(self.series(self.second), [])
+
+    def test_brought_back_series_reaches_other_peers(self):
+        third = self.database()
+        self.add(self.first, "Lain")
+        self.sync()
+        synchronize(self.first, third)
+        self.first.execute("DELETE FROM series")
+        self.first.execute("UPDATE sync_tombstones SET deleted = '2020-01-01 00:00:00'")
+        self.second.execute("UPDATE series SET seen = 5")
+        self.second.execute("UPDATE sync_series SET updated = '2020-01-02 00:00:00'")
+        self.sync()
+        self.assertEqual(self.series(self.first), [("Lain", 13, 5)])
+        synchronize(self.first, third)
+        self.assertEqual(self.series(self.first), [("Lain", 13, 5)])
+        self.assertEqual(self.series(third), [("Lain", 13, 5)])
+        third.close()
+
+    def test_copies_are_told_apart(self):
+        self.add(self.first, "Lain")
+        self.second.close()
+        self.second = sqlite3.connect(":memory:", isolation_level=None)
+        self.first.backup(self.second)
+        self.add(self.second, "Bebop", 26)
+        self.sync()
+        self.assertNotEqual(Replica(self.first).uid, Replica(self.second).uid)
+        self.assertEqual(self.series(self.first), [("Bebop", 26, 0), ("Lain", 13, 0)])
+        self.assertEqual(self.series(self.second), self.series(self.first))
+
+    def test_locked_database_releases_the_other(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [Path(directory) / name for name in ("first.db", "second.db")]
+            connections = [
+                sqlite3.connect(str(path), timeout=0, isolation_level=None)
+                for path in paths
+            ]
+            for connection in connections:
+                migrate(connection)
+            holder = sqlite3.connect(str(paths[1]), isolation_level=None)
+            holder.execute("BEGIN IMMEDIATE")
+            try:
+                with self.assertRaises(sqlite3.OperationalError):
+                    synchronize(*connections)
+                self.assertFalse(connections[0].in_transaction)
+                # The first database can be written to again.
+                other = sqlite3.connect(str(paths[0]), timeout=0)
+                other.execute("BEGIN IMMEDIATE")
+                other.rollback()
+                other.close()
+            finally:
+                holder.execute("ROLLBACK")
+                holder.close()
+                for connection in connections:
+                    connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+# Miru is a tool for maintaining a log of seen tv-series' episodes.
+# Copyright (C) 2011-2019 Samuel Laurén <samuel.lauren@iki.fi>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from io import BytesIO
+
+from miru.database import connect_database
+from miru.migrations import upgrade
+from miru.rules import MAX_COUNT
+from miru.transfer import (
+    InvalidRow,
+    export_rows,
+    import_series,
+    read_binary,
+    read_jsonl,
+    write_binary,
+)
+
+
+def rows(*series):
+    return [
+        (number, {"name": name, "episodes": 13, "seen": seen})
+        for number, (name, seen) in enumerate(series, 1)
+    ]
+
+
+class ImportTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = connect_database(None, memory=True)
+        upgrade(self.engine)
+        self.invalid = []
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def upsert(self, *series, **options):
+        return import_series(
+            self.engine,
+            rows(*series),
+            upsert=True,
+            on_invalid=lambda number, error: self.invalid.append((number, str(error))),
+            **options
+        )
+
+    def series(self):
+        return sorted(self.engine.execute("SELECT name, seen FROM series").fetchall())
+
+    def test_upsert_counts_every_row(self):
+        import_series(self.engine, rows(("Lain", 0), ("Bebop", 0)))
+        result = self.upsert(("Lain", 1), ("Lain", 2), ("Bebop", 3), ("Eva", 4))
+        self.assertEqual(result, (1, 2, 1, 0))
+        self.assertEqual(self.series(), [("Bebop", 3), ("Eva", 4), ("Lain", 2)])
+
+    def test_upsert_skips_ambiguous_names(self):
+        import_series(self.engine, rows(("Lain", 0), ("Lain", 0), ("Bebop", 0)))
+        result = self.upsert(("Lain", 5), ("Bebop", 5))
+        self.assertEqual(result, (0, 1, 0, 1))
+        self.assertEqual(self.invalid, [(1, "2 series are named Lain")])
+        self.assertEqual(self.series(), [("Bebop", 5), ("Lain", 0), ("Lain", 0)])
+        with self.assertRaises(InvalidRow):
+            import_series(self.engine, rows(("Lain", 5)), upsert=True)
+
+    def test_counts_out_of_range_are_invalid(self):
+        lines = [
+            '{"name": "Lain", "episodes": 99999999999999999999999}',
+            '{{"name": "Bebop", "episodes": {}, "seen": {}}}'.format(
+                MAX_COUNT + 1, MAX_COUNT + 1
+            ),
+            '{{"name": "Eva", "episodes": {}}}'.format(MAX_COUNT),
+        ]
+        result = import_series(
+            self.engine,
+            read_jsonl(lines),
+            on_invalid=lambda number, error: self.invalid.append(number),
+        )
+        self.assertEqual(result, (1, 0, 0, 2))
+        self.assertEqual(self.invalid, [1, 2])
+
+
+class BinaryTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = connect_database(None, memory=True)
+        upgrade(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def export(self):
+        stream = BytesIO()
+        write_binary(stream, export_rows(self.engine))
+        stream.seek(0)
+        return stream
+
+    def test_largest_counts_round_trip(self):
+        row = {"name": "Lain", "episodes": MAX_COUNT, "seen": MAX_COUNT}
+        import_series(self.engine, [(1, row)])
+        ((_, exported),) = read_binary(self.export())
+        self.assertEqual(
+            (exported["episodes"], exported["seen"]), (MAX_COUNT, MAX_COUNT)
+        )
+        self.engine.execute("DELETE FROM series")
+        self.assertEqual(import_series(self.engine, [(1, exported)]).inserted, 1)
+
+    def test_larger_counts_are_refused(self):
+        self.engine.execute(
+            "INSERT INTO series (name, episodes, seen) VALUES ('Lain', ?, 0)",
+            MAX_COUNT + 1,
+        )
+        with self.assertRaises(InvalidRow):
+            self.export()
+
+
+if __name__ == "__main__":
+    unittest.main()